@@ -12,5 +12,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'otus_django.settings')
+# serve the read heavy question pages with the async views
+os.environ.setdefault('QUESTIONS_ASYNC_VIEWS', '1')
+# stream live vote counts, see otus_django.events
+os.environ.setdefault('EVENTS_ENABLED', '1')
 
 application = get_asgi_application()
+
+from otus_django.events import with_events  # noqa: E402
+
+# live counter updates are streamed by a plain ASGI application in front of Django
+application = with_events(application)
@@ -0,0 +1,192 @@
+"""
+Live counter updates over Server-Sent Events.
+
+Votes publish the absolute counter values to the in-process EventBroker, per
+topic such as 'poll:1' or 'question:5'. Bursts are coalesced: within
+EVENTS_COALESCE_INTERVAL the latest values of every key are kept, then every
+subscriber of the topic gets one event. As events carry values rather than
+deltas, a client missing some of them or starting from a stale page still ends
+up with the current counts. The stream is served by a plain ASGI
+application mounted in front of Django by otus_django.asgi, Django 3.2 can't
+stream from async generators. Subscribers wait on their own queue, so idle
+connections cost no CPU until something is published for their topic.
+
+The broker lives in the process, events reach the subscribers connected to
+the process that handled the vote.
+"""
+import asyncio
+import json
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+
+class EventBroker:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._pending = {}
+        self._loop = None
+        self._wakeup = None
+        self._scheduled = False
+
+    def subscribe(self, topic):
+        """
+        Returns the queue the events of the topic are put to, must be called in the event loop
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._wakeup, self._scheduled = loop, asyncio.Event(), False
+            loop.create_task(self._flush_forever())
+        queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self._subscribers[topic].add(queue)
+        return queue
+
+    def unsubscribe(self, topic, queue):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def has_subscribers(self, topic):
+        return topic in self._subscribers
+
+    def publish(self, topic, key, **values):
+        """
+        Set the values of a key of a topic, thread safe.
+        Free when nobody is subscribed to the topic.
+        """
+        if topic not in self._subscribers:
+            return
+        with self._lock:
+            self._pending.setdefault(topic, {}).setdefault(key, {}).update(values)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def publish_on_commit(self, topic, key, **values):
+        if topic in self._subscribers:
+            transaction.on_commit(lambda: self.publish(topic, key, **values))
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        for topic, event in pending.items():
+            for queue in self._subscribers.get(topic, ()):
+                if queue.full():
+                    # a stalled client gets one event with the latest values, not a backlog
+                    queue.put_nowait(merge_events(drain(queue) + [event]))
+                else:
+                    queue.put_nowait(event)
+
+    async def _flush_forever(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(settings.EVENTS_COALESCE_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def merge_events(events):
+    merged = {}
+    for event in events:
+        for key, values in event.items():
+            merged.setdefault(key, {}).update(values)
+    return merged
+
+
+broker = EventBroker()
+
+TOPIC_PATHS = {
+    re.compile(r'^polls/(?P<pk>\d+)/$'): 'poll:%s',
+    re.compile(r'^questions/(?P<pk>\d+)/$'): 'question:%s',
+}
+
+
+def events_url(topic_path):
+    """
+    Url of the event stream for pages to subscribe to, None when streams aren't served
+    """
+    if settings.EVENTS_ENABLED:
+        return '%s%s/' % (settings.EVENTS_URL_PREFIX, topic_path)
+
+
+def get_topic(path):
+    path = path[len(settings.EVENTS_URL_PREFIX):]
+    for pattern, topic in TOPIC_PATHS.items():
+        match = pattern.match(path)
+        if match:
+            return topic % match.group('pk')
+
+
+async def events_application(scope, receive, send):
+    """
+    ASGI application streaming the events of the topic of the path
+    """
+    topic = get_topic(scope['path'])
+    if topic is None or scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': b'Not Found'})
+        return
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+    await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+
+    queue = broker.subscribe(topic)
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        while True:
+            event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({event, disconnected}, timeout=settings.EVENTS_KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                event.cancel()
+                break
+            if event in done:
+                body = 'data: %s\n\n' % json.dumps(event.result())
+            else:
+                event.cancel()
+                # keeps proxies from closing the idle connection
+                body = ': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body.encode(), 'more_body': True})
+    finally:
+        disconnected.cancel()
+        broker.unsubscribe(topic, queue)
+
+
+async def wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+def with_events(application):
+    """
+    Route the requests under EVENTS_URL_PREFIX to the event streams, the rest to the application
+    """
+
+    async def router(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'].startswith(settings.EVENTS_URL_PREFIX):
+            return await events_application(scope, receive, send)
+        return await application(scope, receive, send)
+
+    return router
@@ -0,0 +1,259 @@
+"""
+Per-request instrumentation: SQL query count and time, duplicated queries,
+template render time and cache hits and misses.
+
+A sampled share of the requests is measured by InstrumentationMiddleware.
+The measurements are added as a Server-Timing header, logged as one JSON
+line, aggregated per view for the metrics view and sent with the
+request_instrumented signal. Unsampled requests only pay for a context
+variable lookup per query, template render and cache lookup.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import Signal, receiver
+from django.http import JsonResponse
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+logger = logging.getLogger(__name__)
+
+# sent by the cache layers with the layer name as sender and hits, misses counts
+cache_accessed = Signal()
+# sent at the end of every sampled request with its RequestMetrics
+request_instrumented = Signal()
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        # the queries of the async views run in several worker threads at once
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = Counter()
+        self.cache_misses = Counter()
+        self.duration = None
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        """
+        Statements executed at least INSTRUMENTATION_DUPLICATE_THRESHOLD times,
+        the usual shape of an N+1
+        """
+        threshold = settings.INSTRUMENTATION_DUPLICATE_THRESHOLD
+        return {sql: count for sql, count in self.queries.most_common() if count >= threshold}
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join((
+            'db;dur=%.1f;desc="%d queries, %d duplicated"' % (
+                self.db_time * 1000, self.query_count, len(self.duplicates())),
+            'tpl;dur=%.1f' % (self.template_time * 1000),
+            'cache;desc="%d hits, %d misses"' % (sum(self.cache_hits.values()), sum(self.cache_misses.values())),
+            'total;dur=%.1f' % (self.duration * 1000),
+        ))
+
+    def as_dict(self):
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'db_queries': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'duplicates': {sql[:200]: count for sql, count in self.duplicates().items()},
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': dict(self.cache_hits),
+            'cache_misses': dict(self.cache_misses),
+        }
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        with metrics.lock:
+            metrics.db_time += elapsed
+            metrics.queries[sql] += 1
+
+
+def instrument_connection(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    # every new connection, including those of the worker threads of the async views
+    instrument_connection(connection)
+
+
+@receiver(cache_accessed)
+def count_cache_access(sender, hits=0, misses=0, **kwargs):
+    metrics = current_metrics.get()
+    if metrics is not None:
+        with metrics.lock:
+            metrics.cache_hits[sender] += hits
+            metrics.cache_misses[sender] += misses
+
+
+def record_cache(layer, hits=0, misses=0):
+    cache_accessed.send(sender=layer, hits=hits, misses=misses)
+
+
+class InstrumentedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return super(InstrumentedTemplate, self).render(context, request)
+        # templates rendered from template tags are part of the outer render time
+        metrics.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super(InstrumentedTemplate, self).render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - started
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend timing the renders of the instrumented requests
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class ViewMetrics:
+    """
+    Totals of the sampled requests per view, for the metrics view
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(Counter)
+
+    def add(self, view_name, metrics):
+        with self.lock:
+            totals = self.views[view_name]
+            totals['requests'] += 1
+            totals['duration_ms'] += metrics.duration * 1000
+            totals['db_queries'] += metrics.query_count
+            totals['db_ms'] += metrics.db_time * 1000
+            totals['duplicated_queries'] += len(metrics.duplicates())
+            totals['template_ms'] += metrics.template_time * 1000
+            totals['cache_hits'] += sum(metrics.cache_hits.values())
+            totals['cache_misses'] += sum(metrics.cache_misses.values())
+
+    def snapshot(self):
+        with self.lock:
+            return {view_name: dict(totals) for view_name, totals in self.views.items()}
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+
+view_metrics = ViewMetrics()
+
+
+class InstrumentationMiddleware:
+    """
+    Measures a sampled share of the requests, see the module docstring
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        for connection in connections.all():
+            instrument_connection(connection)
+        if asyncio.iscoroutinefunction(get_response):
+            # mark the instance as a coroutine function so Django doesn't wrap it in a thread
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def is_sampled(self, request):
+        return settings.INSTRUMENTATION_ENABLED and random.random() < settings.INSTRUMENTATION_SAMPLE_RATE
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.is_sampled(request):
+            return self.get_response(request)
+        token = current_metrics.set(RequestMetrics())
+        try:
+            response = self.get_response(request)
+            return self.report(request, response, current_metrics.get())
+        finally:
+            current_metrics.reset(token)
+
+    async def __acall__(self, request):
+        if not self.is_sampled(request):
+            return await self.get_response(request)
+        token = current_metrics.set(RequestMetrics())
+        try:
+            response = await self.get_response(request)
+            return self.report(request, response, current_metrics.get())
+        finally:
+            current_metrics.reset(token)
+
+    def report(self, request, response, metrics):
+        metrics.finish()
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        response['Server-Timing'] = metrics.server_timing()
+        view_metrics.add(view_name, metrics)
+        logger.info(json.dumps(dict(metrics.as_dict(), path=request.path, view=view_name,
+                                    method=request.method, status=response.status_code)))
+        request_instrumented.send(sender=self.__class__, request=request, response=response, metrics=metrics)
+        return response
+
+
+def has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(authorization.encode(), ('Bearer %s' % token).encode())
+
+
+def metrics_view(request):
+    """
+    Per view totals of the sampled requests, for staff and the METRICS_TOKEN bearer
+    """
+    if not request.user.is_staff and not has_metrics_token(request):
+        raise PermissionDenied
+    return JsonResponse({
+        'sample_rate': settings.INSTRUMENTATION_SAMPLE_RATE,
+        'views': view_metrics.snapshot(),
+    })
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'otus_django.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,9 +60,28 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'otus_django.urls'
 
+# Instrumentation: share of the requests measured, how many runs of the same statement
+# count as a duplicate. Sampled requests get a Server-Timing header and a JSON log line,
+# totals per view are served at /metrics/ to staff and to requests with the METRICS_TOKEN bearer token
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED') == '1'
+INSTRUMENTATION_SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', '0.1'))
+INSTRUMENTATION_DUPLICATE_THRESHOLD = 3
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'otus_django.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'otus_django.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -143,7 +163,14 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 USER_IMAGE_DIR = 'avatars'
 USER_IMAGE_SIZE = (200, 200)
+# thumbnails generated in one pass, the first size/format is the main thumbnail
+USER_IMAGE_SIZES = (USER_IMAGE_SIZE, (48, 48))
+USER_IMAGE_FORMATS = ('PNG', 'WEBP')
+# process avatars on a background thread pool after the transaction commits
+USER_IMAGE_ASYNC = True
+USER_IMAGE_WORKERS = 2
 USER_IMAGE_PLACEHOLDER = 'users/img/placeholder.png'
+USER_THUMBNAIL_URL_CACHE_TIMEOUT = 60 * 60
 
 ADMIN_DEFAULT_EMAIL = os.getenv('ADMIN_DEFAULT_EMAIL')
 ADMIN_DEFAULT_PASSWORD = os.getenv('ADMIN_DEFAULT_PASSWORD')
@@ -151,7 +178,61 @@ ADMIN_DEFAULT_PASSWORD = os.getenv('ADMIN_DEFAULT_PASSWORD')
 # Questions App
 QUESTIONS_PER_PAGE = 20
 ANSWERS_PER_PAGE = 30
+TAGS_PER_PAGE = 50
+# keyset pagination with opaque cursors instead of page numbers
+QUESTIONS_CURSOR_PAGINATION = False
+QUESTIONS_COUNT_CACHE_TIMEOUT = 300
+# number of tag name => id pairs kept in memory by Tag.objects.resolve
+TAGS_CACHE_SIZE = 1024
+# tag autocomplete: max suggestions, seconds between checks of the shared snapshot, snapshot lifetime
+TAGS_AUTOCOMPLETE_LIMIT = 10
+TAGS_AUTOCOMPLETE_REFRESH = 5
+TAGS_AUTOCOMPLETE_TIMEOUT = 60 * 60
+TRENDING_CACHE_TIMEOUT = 60
+# hot ordering: seconds after which a question needs ten times the votes to rank level
+# with a new one, weight of the answers against the votes
+QUESTIONS_HOT_DECAY = 45000
+QUESTIONS_HOT_ANSWER_WEIGHT = 0.5
+# question cards are cached per question version, the timeout bounds the 'asked ... ago' staleness
+QUESTION_CARD_CACHE_TIMEOUT = 5 * 60
+# anonymous full page cache: seconds a page is fresh, extra seconds a stale copy may be served
+# while it is regenerated, regeneration lock lifetime and how long other async requests wait for it
+PAGE_CACHE_ENABLED = os.getenv('PAGE_CACHE_ENABLED', '1') == '1'
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE_TIMEOUT = 10 * 60
+PAGE_CACHE_LOCK_TIMEOUT = 30
+PAGE_CACHE_LOCK_WAIT = 2
+# route the list, search and detail pages to the async views, turned on by otus_django.asgi
+QUESTIONS_ASYNC_VIEWS = os.getenv('QUESTIONS_ASYNC_VIEWS') == '1'
+# dotted path to a questions.search.SearchBackend, picked by database vendor when None
+QUESTIONS_SEARCH_BACKEND = None
 
 # Email
 EMAIL_SUBJECT_PREFIX = '[Hasker]'
-DEFAULT_FROM_EMAIL = 'hasker@hasker.com'
\ No newline at end of file
+DEFAULT_FROM_EMAIL = 'hasker@hasker.com'
+# new answer notifications are queued and sent by `manage.py send_notifications`
+NOTIFICATION_DIGEST_WINDOW = 60
+NOTIFICATION_LEASE = 300
+NOTIFICATION_RETRY_DELAY = 60
+NOTIFICATION_MAX_ATTEMPTS = 5
+# Votes App
+# write votes through the in-memory write-behind buffer (votes.buffer)
+VOTES_BUFFERED = False
+VOTES_BUFFER_FLUSH_INTERVAL = 1.0
+VOTES_BUFFER_MAX_SIZE = 1000
+
+# Live updates (otus_django.events): turned on by otus_django.asgi, streams mounted under the prefix,
+# seconds votes are coalesced for, keepalive comment interval, events buffered per client
+EVENTS_ENABLED = os.getenv('EVENTS_ENABLED') == '1'
+EVENTS_URL_PREFIX = '/events/'
+EVENTS_COALESCE_INTERVAL = 1.0
+EVENTS_KEEPALIVE = 15
+EVENTS_QUEUE_SIZE = 16
+
+# Polls App
+# counter slots per choice written by polls.views.vote, 0 writes Choice.votes directly;
+# 'random' or 'worker' (one slot per process and thread) slot selection
+POLLS_VOTE_SHARDS = 8
+POLLS_VOTE_SHARD_SELECTION = 'random'
+# seconds the summed results of a poll are cached
+POLLS_RESULTS_CACHE_TIMEOUT = 5
@@ -16,6 +16,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from hasker import views
+from otus_django.instrumentation import metrics_view
 
 urlpatterns = [
     path('', include('questions.urls')),
@@ -23,6 +24,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('polls/',  include('polls.urls')),
     path('hasker/', include("hasker.urls")),
+    path('metrics/', metrics_view, name='metrics'),
 
 
 
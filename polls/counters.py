@@ -0,0 +1,78 @@
+import os
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Choice, ChoiceVoteShard
+
+RESULTS_CACHE_KEY = 'polls:results:%s'
+
+
+def pick_slot():
+    if settings.POLLS_VOTE_SHARD_SELECTION == 'worker':
+        return hash((os.getpid(), threading.get_ident())) % settings.POLLS_VOTE_SHARDS
+    return random.randrange(settings.POLLS_VOTE_SHARDS)
+
+
+def add_vote(choice_id, question_id):
+    """
+    Count a vote in one of the counter slots of the choice, concurrent voters
+    mostly hit different rows instead of all waiting on the lock of the choice row.
+    The cached results of the poll are dropped once the vote is committed.
+    """
+    transaction.on_commit(lambda: cache.delete(RESULTS_CACHE_KEY % question_id))
+    if settings.POLLS_VOTE_SHARDS <= 1:
+        Choice.objects.filter(pk=choice_id).update(votes=F('votes') + 1)
+        return
+    slot = pick_slot()
+    shard = ChoiceVoteShard.objects.filter(choice_id=choice_id, slot=slot)
+    if not shard.update(votes=F('votes') + 1):
+        ChoiceVoteShard.objects.bulk_create([ChoiceVoteShard(choice_id=choice_id, slot=slot)], ignore_conflicts=True)
+        shard.update(votes=F('votes') + 1)
+
+
+def vote_counts(question_id):
+    """
+    {choice pk: votes} of a poll, the compacted votes plus the shards,
+    cached for POLLS_RESULTS_CACHE_TIMEOUT seconds
+    """
+    key = RESULTS_CACHE_KEY % question_id
+    counts = cache.get(key)
+    if counts is None:
+        rows = Choice.objects.filter(question_id=question_id). \
+            annotate(total=F('votes') + Coalesce(Sum('vote_shards__votes'), 0)).values_list('pk', 'total')
+        counts = dict(rows)
+        cache.set(key, counts, settings.POLLS_RESULTS_CACHE_TIMEOUT)
+    return counts
+
+
+def choice_votes(choice_id):
+    """
+    Votes of a choice, the compacted votes plus the shards, not cached
+    """
+    return Choice.objects.filter(pk=choice_id). \
+        annotate(total=F('votes') + Coalesce(Sum('vote_shards__votes'), 0)).values_list('total', flat=True).get()
+
+
+def compact_shards():
+    """
+    Fold the shard counts back into Choice.votes, returns the number of votes moved.
+    Shards are decremented by the amount read, votes counted meanwhile stay in them.
+    """
+    moved = 0
+    choice_ids = ChoiceVoteShard.objects.exclude(votes=0).values_list('choice_id', flat=True).distinct()
+    for choice_id in list(choice_ids):
+        with transaction.atomic():
+            shards = list(ChoiceVoteShard.objects.filter(choice_id=choice_id).exclude(votes=0).
+                          values_list('pk', 'votes'))
+            for pk, votes in shards:
+                ChoiceVoteShard.objects.filter(pk=pk).update(votes=F('votes') - votes)
+            total = sum(votes for _, votes in shards)
+            Choice.objects.filter(pk=choice_id).update(votes=F('votes') + total)
+        moved += total
+    return moved
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from polls.counters import compact_shards
+
+
+class Command(BaseCommand):
+    help = 'Fold the sharded poll vote counters back into Choice.votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep compacting')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between runs')
+
+    def handle(self, *args, **options):
+        while True:
+            self.stdout.write('%d votes compacted' % compact_shards())
+            if not options['loop']:
+                break
+            close_old_connections()
+            time.sleep(options['interval'])
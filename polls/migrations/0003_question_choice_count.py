@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_choice_count(apps, schema_editor):
+    Question = apps.get_model('polls', 'Question')
+    Choice = apps.get_model('polls', 'Choice')
+    counts = Choice.objects.filter(question=OuterRef('pk')).order_by().values('question'). \
+        annotate(count=Count('pk')).values('count')
+    Question.objects.update(choice_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('polls', '0002_choicevoteshard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='choice_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-pub_date'], name='poll_pub_date_idx'),
+        ),
+        migrations.RunPython(backfill_choice_count, migrations.RunPython.noop),
+    ]
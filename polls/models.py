@@ -5,9 +5,27 @@ import datetime
 from django.utils import timezone
 
 
+class QuestionQuerySet(models.QuerySet):
+
+    def published(self):
+        """
+        Questions past their publication date with at least two choices
+        """
+        return self.filter(choice_count__gte=2, pub_date__lte=timezone.now())
+
+
 class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField('date published')
+    # maintained by polls.signals
+    choice_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = QuestionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-pub_date'], name='poll_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.question_text
@@ -27,4 +45,21 @@ class Choice(models.Model):
     votes = models.IntegerField(default=0)
 
     def __str__(self):
-        return self.choice_text
\ No newline at end of file
+        return self.choice_text
+
+
+class ChoiceVoteShard(models.Model):
+    """
+    One of the counter slots of a choice, see polls.counters
+    """
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE, related_name='vote_shards')
+    slot = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['choice', 'slot'], name='unique_choice_vote_shard'),
+        ]
+
+    def __str__(self):
+        return '%s #%d' % (self.choice_id, self.slot)
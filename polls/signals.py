@@ -0,0 +1,17 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Question, Choice
+
+
+@receiver(post_save, sender=Choice)
+def choice_created(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.question_id).update(choice_count=F('choice_count') + 1)
+
+
+@receiver(post_delete, sender=Choice)
+def choice_deleted(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id).update(choice_count=Greatest(F('choice_count') - 1, 0))
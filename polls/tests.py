@@ -1,10 +1,16 @@
 import datetime
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 from django.utils import timezone
 from django.urls import reverse
 
-from .models import Question
+from otus_django.events import broker
+from .counters import add_vote, vote_counts
+from .models import Question, Choice, ChoiceVoteShard
 
 
 class QuestionModelTests(TestCase):
@@ -215,4 +221,85 @@ class QuestionResultsViewTests(TestCase):
         q.choice_set.create(choice_text='Choice 2', votes=0)
         url = reverse('polls:results', args=(q.id,))
         response = self.client.get(url)
-        self.assertContains(response, q.question_text)
\ No newline at end of file
+        self.assertContains(response, q.question_text)
+
+
+@override_settings(POLLS_VOTE_SHARDS=4, POLLS_RESULTS_CACHE_TIMEOUT=60)
+class ShardedVoteTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.question = create_question(question_text='Question.', days=-1)
+        self.choice = self.question.choice_set.create(choice_text='Choice 1', votes=2)
+        self.question.choice_set.create(choice_text='Choice 2', votes=0)
+
+    def test_votes_are_sharded(self):
+        """
+        Votes go to the counter slots of the choice and are summed on read.
+        """
+        for _ in range(10):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).votes, 2)
+        self.assertLessEqual(ChoiceVoteShard.objects.filter(choice=self.choice).count(), 4)
+        self.assertEqual(vote_counts(self.question.pk)[self.choice.pk], 12)
+
+    def test_results_are_cached(self):
+        """
+        The results page reads the cached totals, a vote drops them once committed.
+        """
+        vote_counts(self.question.pk)
+        ChoiceVoteShard.objects.create(choice=self.choice, slot=0, votes=1)
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, '<span data-counter="choice:%d">2</span> votes' % self.choice.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        response = self.client.get(reverse('polls:results', args=(self.question.id,)))
+        self.assertContains(response, '<span data-counter="choice:%d">4</span> votes' % self.choice.pk)
+
+    def test_vote_publishes_total(self):
+        """
+        Live subscribers get the total votes of the choice, not a delta to add up.
+        """
+        add_vote(self.choice.pk, self.question.pk)
+        with mock.patch.object(broker, 'has_subscribers', return_value=True), \
+                mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('polls:vote', args=(self.question.id,)), {'choice': self.choice.id})
+        publish.assert_called_once_with('poll:%s' % self.question.pk, 'choice:%s' % self.choice.pk, votes=4)
+
+    def test_compaction(self):
+        """
+        Compaction folds the shards into the choice without changing the totals.
+        """
+        for _ in range(5):
+            add_vote(self.choice.pk, self.question.pk)
+        call_command('compact_vote_shards', stdout=StringIO())
+        self.assertEqual(Choice.objects.get(pk=self.choice.pk).votes, 7)
+        self.assertEqual(sum(ChoiceVoteShard.objects.values_list('votes', flat=True)), 0)
+        cache.clear()
+        self.assertEqual(vote_counts(self.question.pk)[self.choice.pk], 7)
+
+
+class ChoiceCountTests(TestCase):
+
+    def test_choice_count_is_maintained(self):
+        """
+        choice_count follows the choices added and removed.
+        """
+        q = create_question(question_text='Question.', days=-1)
+        choice = q.choice_set.create(choice_text='Choice 1', votes=0)
+        q.choice_set.create(choice_text='Choice 2', votes=0)
+        self.assertEqual(Question.objects.get(pk=q.pk).choice_count, 2)
+        choice.delete()
+        self.assertEqual(Question.objects.get(pk=q.pk).choice_count, 1)
+
+    def test_published_without_group_by(self):
+        """
+        Visibility is decided on the question row alone.
+        """
+        q = create_question(question_text='Question.', days=-1)
+        q.choice_set.create(choice_text='Choice 1', votes=0)
+        q.choice_set.create(choice_text='Choice 2', votes=0)
+        queryset = Question.objects.published()
+        self.assertNotIn('GROUP BY', str(queryset.query))
+        self.assertEqual(list(queryset), [q])
@@ -1,10 +1,11 @@
+from django.db import transaction
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
-from django.db.models import F, Count
 from django.views import generic
-from django.utils import timezone
 
+from otus_django.events import broker, events_url
+from .counters import add_vote, choice_votes, vote_counts
 from .models import Choice, Question
 
 class IndexView(generic.ListView):
@@ -17,8 +18,7 @@ class IndexView(generic.ListView):
         to be published in the future and not includingthose with less
         han two choices).
         """
-        q = Question.objects.annotate(number_of_choices=Count('choice'))
-        return q.filter(number_of_choices__gte=2, pub_date__lte=timezone.now()).order_by('-pub_date')[:5]
+        return Question.objects.published().order_by('-pub_date')[:5]
 
 
 class DetailView(generic.DetailView):
@@ -29,8 +29,7 @@ class DetailView(generic.DetailView):
         """
         Excludes any questions that aren't published yet and have less than two chices.
         """
-        q = Question.objects.annotate(number_of_choices=Count('choice'))
-        return q.filter(number_of_choices__gte=2, pub_date__lte=timezone.now())
+        return Question.objects.published()
 
 
 class ResultsView(generic.DetailView):
@@ -41,8 +40,20 @@ class ResultsView(generic.DetailView):
         """
         Excludes any questions that aren't published yet and have less than two chices.
         """
-        q = Question.objects.annotate(number_of_choices=Count('choice'))
-        return q.filter(number_of_choices__gte=2, pub_date__lte=timezone.now())
+        return Question.objects.published()
+
+    def get_context_data(self, **kwargs):
+        """
+        Adds the choices with their votes from the cached results of the poll.
+        """
+        context = super().get_context_data(**kwargs)
+        counts = vote_counts(self.object.pk)
+        choices = list(self.object.choice_set.all())
+        for choice in choices:
+            choice.votes = counts.get(choice.pk, choice.votes)
+        context['choices'] = choices
+        context['events_url'] = events_url('polls/%s' % self.object.pk)
+        return context
 
 
 def vote(request, question_id):
@@ -54,6 +65,10 @@ def vote(request, question_id):
                       'polls/detail.html',
                       {'question': question, 'error_message': "You didn't select a choice."})
     else:
-        selected_choice.votes = F('votes') + 1
-        selected_choice.save()
+        add_vote(selected_choice.pk, question.pk)
+        topic = 'poll:%s' % question.id
+        if broker.has_subscribers(topic):
+            # the total is read once the vote is committed, live counters show absolute values
+            transaction.on_commit(lambda: broker.publish(topic, 'choice:%s' % selected_choice.pk,
+                                                         votes=choice_votes(selected_choice.pk)))
         return HttpResponseRedirect(reverse('polls:results', args=(question.id,)))
\ No newline at end of file
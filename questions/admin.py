@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Question, Tag, Answer
+from .models import Question, Tag, Answer, AnswerNotification
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -11,6 +11,12 @@ class AnswerAdmin(admin.ModelAdmin):
     list_display = ('content', 'question', 'user', 'is_right', 'date_pub', 'rank')
 
 
+class AnswerNotificationAdmin(admin.ModelAdmin):
+    list_display = ('question', 'answer_count', 'status', 'attempts', 'send_after', 'date_sent')
+    list_filter = ('status',)
+
+
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Tag)
-admin.site.register(Answer, AnswerAdmin)
\ No newline at end of file
+admin.site.register(Answer, AnswerAdmin)
+admin.site.register(AnswerNotification, AnswerNotificationAdmin)
\ No newline at end of file
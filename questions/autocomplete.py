@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Tag
+
+SNAPSHOT_CACHE_KEY = 'questions:tags:autocomplete'
+
+
+class TagIndex:
+    """
+    Prefix index over tag names weighted by the number of questions.
+
+    Names are kept in a sorted array so a prefix is a bisect plus a range scan,
+    the best tags of every prefix up to PRECOMPUTED_PREFIX characters are
+    precomputed because those ranges cover most of the array.
+    """
+    PRECOMPUTED_PREFIX = 2
+
+    def __init__(self, weights, version=None):
+        self.weights = dict(weights)
+        self.names = sorted(self.weights)
+        self.version = version
+        self._top = {}
+        self._lock = threading.Lock()
+        self._precompute()
+
+    def _precompute(self):
+        top = {}
+        for name in self.names:
+            for length in range(1, min(len(name), self.PRECOMPUTED_PREFIX) + 1):
+                top.setdefault(name[:length], []).append(name)
+        limit = settings.TAGS_AUTOCOMPLETE_LIMIT
+        self._top = {prefix: self._best(names, limit) for prefix, names in top.items()}
+
+    def _best(self, names, limit):
+        return sorted(names, key=lambda name: (-self.weights[name], name))[:limit]
+
+    def add(self, name, weight=0):
+        with self._lock:
+            if name in self.weights:
+                return
+            self.weights[name] = weight
+            insort(self.names, name)
+            self.version = uuid.uuid4().hex
+            for length in range(1, min(len(name), self.PRECOMPUTED_PREFIX) + 1):
+                prefix = name[:length]
+                self._top[prefix] = self._best(self._top.get(prefix, []) + [name], settings.TAGS_AUTOCOMPLETE_LIMIT)
+
+    def search(self, prefix, limit):
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+        if len(prefix) <= self.PRECOMPUTED_PREFIX and limit <= settings.TAGS_AUTOCOMPLETE_LIMIT:
+            return self._top.get(prefix, [])[:limit]
+        start = bisect_left(self.names, prefix)
+        matches = []
+        for name in self.names[start:]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return self._best(matches, limit)
+
+    def snapshot(self):
+        return {'version': self.version, 'weights': self.weights}
+
+
+def build_snapshot():
+    weights = {name: count or 0 for name, count in Tag.objects.values_list('name', 'stats__question_count')}
+    # kept when new tags are merged in, so the weights are rebuilt on schedule
+    expires_at = time.time() + settings.TAGS_AUTOCOMPLETE_TIMEOUT
+    snapshot = {'version': uuid.uuid4().hex, 'weights': weights, 'expires_at': expires_at}
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, settings.TAGS_AUTOCOMPLETE_TIMEOUT)
+    return snapshot
+
+
+_index = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_tag_index():
+    """
+    Returns the process local index, refreshed from the snapshot shared through the cache
+    at most every TAGS_AUTOCOMPLETE_REFRESH seconds
+    """
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < settings.TAGS_AUTOCOMPLETE_REFRESH:
+        return _index
+    with _index_lock:
+        if _index is None or now - _checked_at >= settings.TAGS_AUTOCOMPLETE_REFRESH:
+            snapshot = cache.get(SNAPSHOT_CACHE_KEY) or build_snapshot()
+            if _index is None or snapshot['version'] != _index.version:
+                _index = TagIndex(snapshot['weights'], snapshot['version'])
+            _checked_at = now
+    return _index
+
+
+def add_tags(names):
+    """
+    Add newly created tags to the local index when it is loaded and, once committed,
+    to the shared snapshot the other processes refresh from
+    """
+    index = _index
+    if index is not None:
+        for name in names:
+            index.add(name)
+    transaction.on_commit(lambda: publish_tags(names))
+
+
+def publish_tags(names):
+    """
+    Merge new tags into the shared snapshot without extending its lifetime,
+    without a snapshot the next reader builds one including them
+    """
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        return
+    new = [name for name in names if name not in snapshot['weights']]
+    timeout = snapshot.get('expires_at', 0) - time.time()
+    if not new or timeout <= 0:
+        return
+    snapshot['weights'].update(dict.fromkeys(new, 0))
+    snapshot['version'] = uuid.uuid4().hex
+    cache.set(SNAPSHOT_CACHE_KEY, snapshot, timeout)
+
+
+def reset_tag_index():
+    global _index
+    with _index_lock:
+        _index = None
+    cache.delete(SNAPSHOT_CACHE_KEY)
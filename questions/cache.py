@@ -0,0 +1,86 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from otus_django.instrumentation import record_cache
+from .models import Question
+
+TRENDING_CACHE_KEY = 'questions:trending'
+CARD_VERSION_CACHE_KEY = 'questions:card:version:%s'
+CARD_CACHE_KEY = 'questions:card:%s:%s'
+
+
+def get_trending():
+    """
+    Returns the trending questions as a list of {'pk', 'title', 'rank', 'hot_score'} dicts,
+    served from the cache and recomputed when missing
+    """
+    trending = cache.get(TRENDING_CACHE_KEY)
+    record_cache('trending', hits=trending is not None, misses=trending is None)
+    if trending is None:
+        trending = list(Question.objects_related.trending(settings.QUESTIONS_PER_PAGE).
+                        values('pk', 'title', 'rank', 'hot_score'))
+        cache.set(TRENDING_CACHE_KEY, trending, settings.TRENDING_CACHE_TIMEOUT)
+    return trending
+
+
+def invalidate_trending():
+    transaction.on_commit(lambda: cache.delete(TRENDING_CACHE_KEY))
+
+
+def affects_trending(pk, rank, delta=None, hot_score=None):
+    """
+    Whether a question with the given pk and new rank may change the cached list: it is
+    already listed, or it can enter the list ordered by hot score. Votes don't change hot
+    scores (recompute_hot_scores drops the list when it does), so a vote only lets an unlisted
+    question in when its rank turns positive. Without a hot score its rank turning positive
+    is enough.
+    """
+    trending = cache.get(TRENDING_CACHE_KEY)
+    if trending is None:
+        return False
+    if pk is None or any(question['pk'] == pk for question in trending):
+        return True
+    if rank is None:
+        return True
+    if rank <= 0:
+        return False
+    if hot_score is None:
+        return delta is None or rank - delta <= 0
+    return len(trending) < settings.QUESTIONS_PER_PAGE or hot_score >= trending[-1]['hot_score']
+
+
+def get_card_versions(pks):
+    """
+    Returns {pk: version} of the question card fragments, unknown versions are initialized
+    """
+    keys = {CARD_VERSION_CACHE_KEY % pk: pk for pk in pks}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {pk: uuid.uuid4().hex for pk in pks if pk not in versions}
+    if missing:
+        cache.set_many({CARD_VERSION_CACHE_KEY % pk: version for pk, version in missing.items()}, None)
+        versions.update(missing)
+    return versions
+
+
+def bump_versions(keys):
+    """
+    Replace the version stored under each key with a new one after the transaction commits,
+    in a single cache write
+    """
+    versions = {key: uuid.uuid4().hex for key in keys}
+    if versions:
+        transaction.on_commit(lambda: cache.set_many(versions, None))
+
+
+def card_version_keys(pks):
+    return [CARD_VERSION_CACHE_KEY % pk for pk in pks if pk]
+
+
+def bump_card_version(*pks):
+    """
+    Invalidate the cached card fragments of the questions after the transaction commits
+    """
+    bump_versions(card_version_keys(pks))
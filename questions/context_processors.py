@@ -1,24 +1,17 @@
-from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
-from votes.models import Vote
-from .models import Question
+from .cache import get_trending
+from .votes import UserVotes
 
 
 def trending(request):
-    questions = Question.objects_related.trending(settings.QUESTIONS_PER_PAGE)
-    ctx = {'trending': questions}
+    # async views fetch the trending questions along with the page
+    trending_questions = getattr(request, 'trending', None)
+    ctx = {'trending': trending_questions if trending_questions is not None else SimpleLazyObject(get_trending)}
     return ctx
 
 
 def user_votes(request):
-    ctx = {
-        'question': {},
-        'answer': {}
-    }
-    if request.user.is_authenticated:
-        votes = Vote.objects.filter(user=request.user).select_related('content_type'). \
-            values_list('content_type__model', 'object_id', 'vote').all()
-        for (model_name, pk, vote) in votes:
-            ctx[model_name][pk] = vote
-    ctx = {'votes': ctx}
-    return ctx
\ No newline at end of file
+    votes = getattr(request, 'user_votes', None)
+    ctx = {'votes': votes if votes is not None else UserVotes(request.user)}
+    return ctx
@@ -8,13 +8,14 @@ class CommaSeparatedTextField(forms.Field):
     widget = forms.TextInput()
 
     def to_python(self, value):
+        """
+        Returns the normalized tag names, tags are resolved when the form is saved
+        """
         tags = []
         if value:
-            values = [i.lower() for i in map(str.strip, value.split(',')) if i]
+            values = list(dict.fromkeys(i.lower() for i in map(str.strip, value.split(',')) if i))
             if len(values) <= 3:
-                for tag_name in values:
-                    tags.append(Tag.objects.get_or_create(name=tag_name)[0])
-                return tags
+                return values
             else:
                 raise ValidationError('Max 3 tags is allowed')
         return tags
@@ -29,6 +30,11 @@ class QuestionAddForm(forms.ModelForm):
         model = Question
         fields = ('title', 'content', 'tags')
 
+    def save(self, commit=True):
+        # the tags are resolved to ids before saving, so save_m2m sets them with commit=False too
+        self.cleaned_data['tags'] = Tag.objects.resolve(self.cleaned_data['tags'])
+        return super(QuestionAddForm, self).save(commit)
+
 
 class AnswerAddForm(forms.ModelForm):
     content = forms.CharField(widget=forms.Textarea, label='Your Answer')
@@ -0,0 +1,53 @@
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+from .models import Question
+
+# scores count the seconds from this date, any fixed date works
+HOT_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def hot_score(rank, answer_count, date_pub):
+    """
+    Time decayed hotness: the order of magnitude of the votes and the answers plus
+    the age term. A question needs ten times the votes of one asked QUESTIONS_HOT_DECAY
+    seconds later to rank level with it. The decay is relative between questions,
+    so a score only changes along with the votes and answers of its question.
+    """
+    sign = (rank > 0) - (rank < 0)
+    votes = sign * math.log10(max(abs(rank), 1))
+    answers = settings.QUESTIONS_HOT_ANSWER_WEIGHT * math.log10(1 + answer_count)
+    return round(votes + answers + (date_pub - HOT_EPOCH).total_seconds() / settings.QUESTIONS_HOT_DECAY, 7)
+
+
+def question_created(question):
+    question.hot_score = hot_score(question.rank, question.answer_count, question.date_pub)
+    Question.objects.filter(pk=question.pk).update(hot_score=question.hot_score)
+
+
+def recompute_hot_scores(since=None, batch_size=1000):
+    """
+    Recompute the scores of the questions active since the given time, of all questions
+    when it's None. Returns the number of questions updated.
+    """
+    questions = Question.objects.order_by('pk')
+    if since is not None:
+        questions = questions.filter(last_activity__gte=since)
+    updated = 0
+    last_pk = 0
+    while True:
+        batch = list(questions.filter(pk__gt=last_pk).only('pk', 'rank', 'answer_count', 'date_pub', 'hot_score').
+                     order_by('pk')[:batch_size])
+        if not batch:
+            return updated
+        changed = []
+        for question in batch:
+            score = hot_score(question.rank, question.answer_count, question.date_pub)
+            if score != question.hot_score:
+                question.hot_score = score
+                changed.append(question)
+        Question.objects.bulk_update(changed, ['hot_score'])
+        updated += len(changed)
+        last_pk = batch[-1].pk
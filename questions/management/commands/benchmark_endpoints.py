@@ -0,0 +1,162 @@
+import json
+import random
+import time
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from questions.models import Question, TagStats
+from questions.management.commands.seed_data import WORDS
+from users.models import UserProfile
+
+
+def percentile(timings, p):
+    return timings[min(len(timings) - 1, int(len(timings) * p / 100))]
+
+
+def summarize(timings, queries, errors):
+    timings = sorted(timings)
+    return {
+        'p50': percentile(timings, 50) * 1000,
+        'p95': percentile(timings, 95) * 1000,
+        'p99': percentile(timings, 99) * 1000,
+        'queries': sum(queries) / len(queries),
+        'errors': errors,
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compare benchmark results with a baseline: p95 latency may grow by the tolerance
+    ratio, queries per request and errors may not grow at all
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append('%s: p95 %.1f ms, baseline %.1f ms' % (name, result['p95'], base['p95']))
+        if result['queries'] > base['queries']:
+            regressions.append('%s: %.1f queries per request, baseline %.1f' % (
+                name, result['queries'], base['queries']))
+        if result['errors'] > base.get('errors', 0):
+            regressions.append('%s: %d errors, baseline %d' % (name, result['errors'], base.get('errors', 0)))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the index, hot, search, tag, detail and vote endpoints through the test client ' \
+           'against seeded data in a throwaway test database: latency percentiles and queries per request, ' \
+           'compared with a stored baseline'
+
+    scenarios = ('index', 'hot', 'search', 'tag', 'detail', 'vote')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--scenario', action='append', choices=self.scenarios, dest='scenarios')
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'))
+        parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 growth ratio')
+        parser.add_argument('--page-cache', action='store_true', help='Keep the anonymous page cache on')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=1000, help='Users seeded in the throwaway database')
+        parser.add_argument('--questions', type=int, default=10000)
+        parser.add_argument('--answers', type=int, default=30000)
+        parser.add_argument('--votes', type=int, default=100000)
+        parser.add_argument('--tags', type=int, default=500)
+
+    def get_targets(self):
+        questions = list(Question.objects.order_by('-rank').values_list('pk', flat=True)[:1000])
+        tags = list(TagStats.objects.order_by('-question_count').values_list('tag__name', flat=True)[:100])
+        user = UserProfile.objects.order_by('pk').first()
+        if not questions or not tags or user is None:
+            raise CommandError('Not enough data to benchmark, run `manage.py seed_data` first')
+        return questions, tags, user
+
+    def requests(self, name, questions, tags):
+        """
+        Endpoint factories: (method, path, extra) of the next request of a scenario
+        """
+        index = reverse('questions:index')
+        search = reverse('questions:search')
+        return {
+            'index': lambda: ('get', index, {'page': random.randint(1, 5)}),
+            'hot': lambda: ('get', index, {'order_by': 'hot', 'page': random.randint(1, 5)}),
+            'search': lambda: ('get', search, {'s': ' '.join(random.sample(WORDS[:20], 2))}),
+            'tag': lambda: ('get', search, {'t': random.choice(tags)}),
+            'detail': lambda: ('get', reverse('questions:detail', kwargs={'pk': random.choice(questions)}), {}),
+            'vote': lambda: ('post', reverse('questions:vote', kwargs={
+                'object_name': 'question', 'object_id': random.choice(questions),
+                'vote': random.choice(('up', 'down'))}), {}),
+        }[name]
+
+    def run_scenario(self, client, next_request, options):
+        timings, queries, errors = [], [], 0
+        for i in range(options['warmup'] + options['requests']):
+            method, path, data = next_request()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data, HTTP_REFERER='/')
+                elapsed = time.perf_counter() - started
+            if i < options['warmup']:
+                continue
+            timings.append(elapsed)
+            queries.append(len(context.captured_queries))
+            errors += response.status_code >= 400
+        return summarize(timings, queries, errors)
+
+    def run(self, options):
+        random.seed(options['seed'])
+        questions, tags, user = self.get_targets()
+        anonymous = Client(raise_request_exception=False)
+        authenticated = Client(raise_request_exception=False)
+        authenticated.force_login(user)
+
+        results = {}
+        for name in options['scenarios'] or self.scenarios:
+            client = authenticated if name == 'vote' else anonymous
+            results[name] = self.run_scenario(client, self.requests(name, questions, tags), options)
+            self.stdout.write('%-7s p50 %7.2f ms  p95 %7.2f ms  p99 %7.2f ms  %5.1f queries/request  errors %d' % (
+                name, *(results[name][key] for key in ('p50', 'p95', 'p99', 'queries', 'errors'))))
+        return results
+
+    def handle(self, *args, **options):
+        overrides = {'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver']}
+        if not options['page_cache']:
+            overrides['PAGE_CACHE_ENABLED'] = False
+        # the data is committed so on_commit work runs as in production, the votes
+        # change it, so it lives in a test database dropped at the end
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('seed_data', seed=options['seed'], stdout=StringIO(),
+                         **{key: options[key] for key in ('users', 'questions', 'answers', 'votes', 'tags')})
+            with override_settings(**overrides):
+                results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write('Baseline saved to %s' % options['baseline'])
+            return
+
+        try:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            self.stdout.write('No baseline at %s, run with --save-baseline to store one' % options['baseline'])
+            return
+        regressions = find_regressions(results, baseline, options['tolerance'])
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n%s' % '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,104 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from questions.hotness import hot_score
+from questions.models import Question, Answer, QuestionVote
+from users.models import UserProfile
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Seed a large dataset in a rolled back transaction and compare hot query plans ' \
+           'and timings with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=100000)
+        parser.add_argument('--answers-per-question', type=int, default=3)
+        parser.add_argument('--votes-per-question', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def seed(self, options):
+        now = time.time()
+        UserProfile.objects.bulk_create(
+            [UserProfile(username='bench%d' % i, email='bench%d@example.com' % i) for i in range(1000)])
+        # sqlite doesn't return primary keys from bulk_create
+        users = list(UserProfile.objects.filter(username__startswith='bench'))
+        Question.objects.bulk_create(
+            [self.question(i, random.choice(users)) for i in range(options['questions'])], batch_size=5000)
+        questions = list(Question.objects.filter(user__in=users).order_by('pk'))
+        Answer.objects.bulk_create(
+            [Answer(question=question, content='Answer', user=random.choice(users), rank=random.randint(-2, 5))
+             for question in questions for _ in range(options['answers_per_question'])], batch_size=5000)
+        QuestionVote.objects.bulk_create(
+            [QuestionVote(user=user, target=question, vote=QuestionVote.VOTE_UP)
+             for question in questions
+             for user in random.sample(users, options['votes_per_question'])], batch_size=5000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write('Seeded in %.1fs' % (time.time() - now))
+        return users, questions
+
+    def question(self, i, user):
+        # spread over a month so the hot order isn't just the rank order
+        rank = int(random.paretovariate(1.5)) - 1
+        date_pub = timezone.now() - timedelta(seconds=random.randint(0, 30 * 24 * 3600))
+        return Question(title='Question %d' % i, content='Content', user=user, rank=rank, date_pub=date_pub,
+                        hot_score=hot_score(rank, 0, date_pub))
+
+    def hot_queries(self, users, questions):
+        question = random.choice(questions)
+        user = random.choice(users)
+        return {
+            'index new': Question.objects.order_by('-date_pub')[:20],
+            'index top': Question.objects.order_by('-rank', '-date_pub')[:20],
+            'index hot': Question.objects.order_by('-hot_score', '-date_pub')[:20],
+            'trending': Question.objects_related.trending(20),
+            'answers': Answer.objects.filter(question=question).order_by('-rank', '-date_pub')[:30],
+            'vote lookup': QuestionVote.objects.filter(target=question, user=user),
+        }
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            self.stdout.write('%-12s %8.3f ms' % (name, elapsed))
+            for row in self.explain(title, queryset):
+                self.stdout.write('    %s' % ' '.join(map(str, row)))
+
+    def explain(self, title, queryset):
+        # the comment makes the statement text unique, otherwise sqlite3 may reuse
+        # the cached EXPLAIN statement prepared before the indexes were dropped
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('%s /* %s */ %s' % (connection.ops.explain_query_prefix(), title, sql), params)
+            return cursor.fetchall()
+
+    def drop_indexes(self):
+        # unique constraints are kept, sqlite can't drop them without rebuilding the table
+        schema_editor = connection.schema_editor(atomic=False)
+        for model in (Question, Answer, QuestionVote):
+            for index in model._meta.indexes:
+                schema_editor.remove_index(model, index)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                users, questions = self.seed(options)
+                queries = self.hot_queries(users, questions)
+                self.report('With indexes', queries, options['repeat'])
+                self.drop_indexes()
+                self.report('Without indexes', queries, options['repeat'])
+                raise Rollback
+        except Rollback:
+            self.stdout.write('Benchmark data rolled back')
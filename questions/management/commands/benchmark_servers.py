@@ -0,0 +1,104 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from questions.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Start the project under a WSGI and an ASGI server and compare the throughput ' \
+           'of the question pages under concurrent load'
+
+    servers = {
+        # the threaded development server is the only WSGI server the project depends on
+        'wsgi': lambda port: [sys.executable, '-m', 'django', 'runserver', '--noreload', '127.0.0.1:%d' % port],
+        'asgi': lambda port: [sys.executable, '-m', 'uvicorn', 'otus_django.asgi:application',
+                              '--port', str(port), '--log-level', 'warning'],
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--page-cache', action='store_true',
+                            help='Keep the anonymous page cache on, measures cache hits then')
+
+    def get_paths(self):
+        question = Question.objects.order_by('-rank').first()
+        if question is None:
+            raise CommandError('No questions to request, seed the database first')
+        return [reverse('questions:index'), reverse('questions:index') + '?order_by=hot',
+                reverse('questions:detail', kwargs={'pk': question.pk}),
+                reverse('questions:search') + '?s=question']
+
+    def start(self, name, port, options):
+        env = dict(os.environ, QUESTIONS_ASYNC_VIEWS='1' if name == 'asgi' else '0',
+                   PAGE_CACHE_ENABLED='1' if options['page_cache'] else '0')
+        process = subprocess.Popen(self.servers[name](port), cwd=settings.BASE_DIR, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError('%s server exited with code %d' % (name, process.returncode))
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return process
+            except OSError:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError('%s server did not start' % name)
+
+    def request(self, port, path):
+        started = time.perf_counter()
+        connection = HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            return response.status, time.perf_counter() - started
+        finally:
+            connection.close()
+
+    def load(self, port, paths, options):
+        # warm up the process: url resolver, templates, connections
+        for path in paths:
+            self.request(port, path)
+        targets = [paths[i % len(paths)] for i in range(options['requests'])]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(lambda path: self.request(port, path), targets))
+        return time.perf_counter() - started, results
+
+    def report(self, name, elapsed, results):
+        timings = sorted(timing for _, timing in results)
+        errors = sum(1 for status, _ in results if status != 200)
+
+        def percentile(p):
+            return timings[min(len(timings) - 1, int(len(timings) * p / 100))] * 1000
+
+        self.stdout.write('%-5s %8.1f req/s  p50 %7.1f ms  p95 %7.1f ms  p99 %7.1f ms  errors %d' % (
+            name, len(results) / elapsed, percentile(50), percentile(95), percentile(99), errors))
+
+    def handle(self, *args, **options):
+        if find_spec('uvicorn') is None:
+            raise CommandError('The ASGI benchmark needs uvicorn: pip install uvicorn')
+        paths = self.get_paths()
+        self.stdout.write('%d requests, concurrency %d, paths: %s' % (
+            options['requests'], options['concurrency'], ' '.join(paths)))
+        for name in ('wsgi', 'asgi'):
+            process = self.start(name, options['port'], options)
+            try:
+                elapsed, results = self.load(options['port'], paths, options)
+            finally:
+                process.terminate()
+                process.wait()
+            self.report(name, elapsed, results)
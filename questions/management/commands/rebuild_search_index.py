@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from questions.models import Question
+from questions.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the question search index from scratch'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            backend.rebuild(Question.objects.order_by())
+        self.stdout.write('Search index rebuilt with %s' % type(backend).__name__)
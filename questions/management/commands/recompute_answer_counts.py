@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from questions.models import Question, Answer
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized answer_count of questions from the answers table'
+
+    def handle(self, *args, **options):
+        count = Answer.objects.filter(question=OuterRef('pk')).order_by(). \
+            values('question').annotate(count=Count('pk')).values('count')
+        updated = Question.objects.update(answer_count=Coalesce(Subquery(count), 0))
+        self.stdout.write('%d answer counts recomputed' % updated)
@@ -0,0 +1,43 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from questions.cache import invalidate_trending
+from questions.hotness import recompute_hot_scores
+from questions.pagecache import invalidate_pages
+from questions.tagstats import refresh_active_tags
+
+
+class Command(BaseCommand):
+    help = 'Recompute the hot scores of the questions with recent votes or answers ' \
+           'and the top questions of their tags'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=int, default=15,
+                            help='Minutes of activity to cover on the first run')
+        parser.add_argument('--all', action='store_true', help='Recompute every question')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep recomputing, covering the activity '
+                                                                 'since the previous run')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between runs')
+
+    def handle(self, *args, **options):
+        since = None if options['all'] else timezone.now() - timedelta(minutes=options['since'])
+        while True:
+            started = timezone.now()
+            with transaction.atomic():
+                updated = recompute_hot_scores(since, options['batch_size'])
+                refresh_active_tags(since)
+                if updated:
+                    invalidate_trending()
+                    invalidate_pages()
+            self.stdout.write('%d hot scores updated' % updated)
+            if not options['loop']:
+                break
+            # activity committed while this run was reading is picked up by the next one
+            since = started - timedelta(seconds=options['interval'])
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from questions.models import TagStats
+from questions.tagstats import rebuild_tag_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized tag statistics from the questions tags'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_tag_stats()
+        self.stdout.write('%d tag stats rebuilt' % TagStats.objects.count())
@@ -0,0 +1,141 @@
+import itertools
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from questions.hotness import hot_score
+from questions.models import Question, Answer, Tag
+from users.models import UserProfile
+from votes.models import Vote
+
+WORDS = (
+    'python', 'django', 'query', 'index', 'cache', 'model', 'view', 'template', 'form', 'signal',
+    'migration', 'database', 'postgres', 'sqlite', 'async', 'thread', 'request', 'response', 'session',
+    'user', 'login', 'test', 'admin', 'static', 'media', 'upload', 'image', 'email', 'search', 'tag',
+    'vote', 'rank', 'page', 'cursor', 'json', 'api', 'error', 'exception', 'deploy', 'docker', 'nginx',
+    'gunicorn', 'uvicorn', 'celery', 'redis', 'memcached', 'logging', 'settings', 'middleware', 'url',
+)
+
+
+class Command(BaseCommand):
+    help = 'Seed a large synthetic dataset with bulk inserts: power law distributed tags, ' \
+           'answers and votes, consistent ranks and counters, then rebuild the derived data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--questions', type=int, default=1000000)
+        parser.add_argument('--answers', type=int, default=5000000)
+        parser.add_argument('--votes', type=int, default=20000000)
+        parser.add_argument('--tags', type=int, default=5000)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable datasets')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help="Don't rebuild the tag stats and the search index")
+
+    def power_law(self, mean, limit, alpha=1.5):
+        """
+        A power law (Lomax) distributed count with the given mean, capped by limit:
+        most values are small, few are very large
+        """
+        return min(limit, int((random.paretovariate(alpha) - 1) * mean * (alpha - 1)))
+
+    def new_pks(self, model, last_pk):
+        return list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True))
+
+    def last_pk(self, model):
+        return model.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+    def seed_users(self, count, batch_size):
+        last_pk = self.last_pk(UserProfile)
+        prefix = 'seed%d_' % int(time.time())
+        UserProfile.objects.bulk_create(
+            (UserProfile(username='%s%d' % (prefix, i), email='%s%d@example.com' % (prefix, i))
+             for i in range(count)), batch_size=batch_size)
+        return self.new_pks(UserProfile, last_pk)
+
+    def seed_tags(self, count, batch_size):
+        existing = set(Tag.objects.values_list('name', flat=True))
+        names = [name for name in ('%s-%d' % (random.choice(WORDS), i) for i in range(count)) if name not in existing]
+        Tag.objects.bulk_create((Tag(name=name) for name in names), batch_size=batch_size)
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+        random.shuffle(tag_ids)
+        # zipf weights: the first tags of the shuffled list are the popular ones
+        return tag_ids, list(itertools.accumulate(1 / (rank + 1) for rank in range(len(tag_ids))))
+
+    def title(self):
+        return ' '.join(random.choices(WORDS, cum_weights=self.word_weights, k=random.randint(4, 9))).capitalize()
+
+    def plan_question(self, users, options):
+        """
+        Decide the answers and votes of a question: votes are spread over the question
+        and its answers, at most one vote per user for the whole thread
+        """
+        answers = self.power_law(options['answers'] / options['questions'], 200)
+        voters = random.sample(users, self.power_law(options['votes'] / options['questions'], len(users)))
+        votes = [(random.randint(0, answers), user_id, Vote.VOTE_UP if random.random() < 0.8 else Vote.VOTE_DOWN)
+                 for user_id in voters]
+        ranks = [0] * (answers + 1)
+        for target, _, vote in votes:
+            ranks[target] += vote
+        return answers, votes, ranks
+
+    def seed_batch(self, size, users, tag_ids, tag_weights, options):
+        plans = [self.plan_question(users, options) for _ in range(size)]
+
+        last_pk = self.last_pk(Question)
+        now = timezone.now()
+        Question.objects.bulk_create(
+            [Question(title=self.title(), content=self.title(), user_id=random.choice(users),
+                      rank=ranks[0], answer_count=answers, hot_score=hot_score(ranks[0], answers, now))
+             for answers, _, ranks in plans], batch_size=options['batch_size'])
+        question_pks = self.new_pks(Question, last_pk)
+
+        last_pk = self.last_pk(Answer)
+        Answer.objects.bulk_create(
+            [Answer(question_id=question_pk, content=self.title(), user_id=random.choice(users), rank=rank)
+             for question_pk, (_, _, ranks) in zip(question_pks, plans) for rank in ranks[1:]],
+            batch_size=options['batch_size'])
+        answer_pks = iter(self.new_pks(Answer, last_pk))
+
+        through = Question.tags.through
+        question_tags, votes = [], {Question: [], Answer: []}
+        for question_pk, (answers, question_votes, _) in zip(question_pks, plans):
+            targets = [(Question, question_pk)] + [(Answer, next(answer_pks)) for _ in range(answers)]
+            for target, user_id, vote in question_votes:
+                model, object_id = targets[target]
+                votes[model].append(model.get_vote_model().build(model, object_id, user_id, vote))
+            for tag_id in set(random.choices(tag_ids, cum_weights=tag_weights, k=random.randint(1, 4))):
+                question_tags.append(through(question_id=question_pk, tag_id=tag_id))
+        through.objects.bulk_create(question_tags, batch_size=options['batch_size'])
+        for model, model_votes in votes.items():
+            model.get_vote_model().objects.bulk_create(model_votes, batch_size=options['batch_size'])
+        return len(question_pks), sum(answers for answers, _, _ in plans), sum(map(len, votes.values()))
+
+    def handle(self, *args, **options):
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        started = time.time()
+        self.word_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(WORDS))))
+
+        with transaction.atomic():
+            users = self.seed_users(options['users'], options['batch_size'])
+            tag_ids, tag_weights = self.seed_tags(options['tags'], options['batch_size'])
+        self.stdout.write('%d users and %d tags created' % (len(users), len(tag_ids)))
+
+        totals = [0, 0, 0]
+        for offset in range(0, options['questions'], options['batch_size']):
+            size = min(options['batch_size'], options['questions'] - offset)
+            # signals are bypassed by bulk_create, the derived data is rebuilt at the end
+            with transaction.atomic():
+                counts = self.seed_batch(size, users, tag_ids, tag_weights, options)
+            totals = [total + count for total, count in zip(totals, counts)]
+            self.stdout.write('%d questions, %d answers, %d votes (%.0fs)' % (*totals, time.time() - started))
+
+        if not options['skip_derived']:
+            call_command('recompute_tag_stats', stdout=self.stdout)
+            call_command('rebuild_search_index', stdout=self.stdout)
+        self.stdout.write('Seeded in %.1fs' % (time.time() - started))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from questions.utils import send_due_notifications
+
+
+class Command(BaseCommand):
+    help = 'Send queued new answer notifications'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue')
+        parser.add_argument('--interval', type=float, default=5.0, help='Polling interval in seconds')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_due_notifications(options['batch_size'])
+            if sent or failed:
+                self.stdout.write('%d notifications sent, %d failed' % (sent, failed))
+            if not options['loop']:
+                break
+            if sent + failed < options['batch_size']:
+                close_old_connections()
+                time.sleep(options['interval'])
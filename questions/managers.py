@@ -1,12 +1,12 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
 from django.db import models
-from django.db.models import Count
 
 
 class QuestionRelationsQuerySet(models.QuerySet):
 
-    def num_answers(self):
-        return self.annotate(num_answers=Count('answers', distinct=True))
-
     def tags(self):
         return self.prefetch_related('tags')
 
@@ -18,14 +18,79 @@ class QuestionRelationsManager(models.Manager):
     def get_queryset(self):
         return QuestionRelationsQuerySet(self.model, using=self._db)
 
-    def num_answers(self):
-        return self.get_queryset().num_answers()
-
     def tags(self):
-        return self.self.get_queryset().tags()
+        return self.get_queryset().tags()
 
     def users(self):
-        return self.self.get_queryset().users()
+        return self.get_queryset().users()
 
     def trending(self, limit):
-        return self.get_queryset().filter(rank__gt=0).order_by('-rank', '-date_pub')[0:limit]
\ No newline at end of file
+        return self.get_queryset().filter(rank__gt=0).order_by('-hot_score', '-date_pub')[0:limit]
+
+
+class TagIdCache:
+    """
+    Thread safe in-process LRU of tag name => id
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, names):
+        found = {}
+        with self._lock:
+            for name in names:
+                if name in self._data:
+                    self._data.move_to_end(name)
+                    found[name] = self._data[name]
+        return found
+
+    def set_many(self, mapping):
+        with self._lock:
+            for name, pk in mapping.items():
+                self._data[name] = pk
+                self._data.move_to_end(name)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, name):
+        with self._lock:
+            self._data.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TagManager(models.Manager):
+    id_cache = TagIdCache(settings.TAGS_CACHE_SIZE)
+
+    def resolve(self, names):
+        """
+        Returns the ids of the tags with the given names creating the missing ones,
+        with at most two SELECTs and one INSERT for names not in the LRU cache
+        """
+        ids = self.lookup(names)
+        new = [name for name in names if name not in ids]
+        if new:
+            self.bulk_create([self.model(name=name) for name in new], ignore_conflicts=True)
+            found = dict(self.filter(name__in=new).values_list('name', 'pk'))
+            self.id_cache.set_many(found)
+            ids.update(found)
+            from .autocomplete import add_tags
+            add_tags(new)
+        return [ids[name] for name in names]
+
+    def lookup(self, names):
+        """
+        Returns {name: id} of the existing tags with the given names
+        """
+        ids = self.id_cache.get_many(names)
+        missing = [name for name in names if name not in ids]
+        if missing:
+            found = dict(self.filter(name__in=missing).values_list('name', 'pk'))
+            self.id_cache.set_many(found)
+            ids.update(found)
+        return ids
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+FTS_TABLE = 'questions_question_fts'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(title, content)' % FTS_TABLE)
+    schema_editor.execute('INSERT INTO %s (rowid, title, content) '
+                          'SELECT id, title, content FROM questions_question' % FTS_TABLE)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
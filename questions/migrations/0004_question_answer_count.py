@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_answer_count(apps, schema_editor):
+    Question = apps.get_model('questions', 'Question')
+    Answer = apps.get_model('questions', 'Answer')
+    count = Answer.objects.filter(question=OuterRef('pk')).order_by(). \
+        values('question').annotate(count=Count('pk')).values('count')
+    Question.objects.update(answer_count=Coalesce(Subquery(count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0003_question_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='answer_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_answer_count, migrations.RunPython.noop),
+    ]
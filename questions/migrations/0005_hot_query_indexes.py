@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0004_question_answer_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['-date_pub'], name='answer_date_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='answer',
+            index=models.Index(fields=['question', '-rank', '-date_pub'], name='answer_question_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-date_pub'], name='question_date_pub_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-rank', '-date_pub'], name='question_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(condition=models.Q(('rank__gt', 0)), fields=['-rank', '-date_pub'], name='question_trending_idx'),
+        ),
+    ]
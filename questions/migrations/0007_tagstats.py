@@ -0,0 +1,40 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:51
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def backfill_tag_stats(apps, schema_editor):
+    Tag = apps.get_model('questions', 'Tag')
+    TagStats = apps.get_model('questions', 'TagStats')
+    Question = apps.get_model('questions', 'Question')
+    stats = []
+    for pk, count in Tag.objects.annotate(count=Count('question')).values_list('pk', 'count').iterator():
+        top = Question.objects.filter(tags=pk).order_by('-rank', '-date_pub').values_list('pk', 'rank')[:20]
+        stats.append(TagStats(tag_id=pk, question_count=count, top_questions=[list(row) for row in top]))
+    TagStats.objects.bulk_create(stats, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0006_answernotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStats',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='questions.tag')),
+                ('question_count', models.PositiveIntegerField(default=0)),
+                ('last_activity', models.DateTimeField(blank=True, null=True)),
+                ('top_questions', models.JSONField(blank=True, default=list)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tagstats',
+            index=models.Index(fields=['-question_count'], name='tagstats_question_count_idx'),
+        ),
+        migrations.RunPython(backfill_tag_stats, migrations.RunPython.noop),
+    ]
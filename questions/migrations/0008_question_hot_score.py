@@ -0,0 +1,67 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:07
+
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# frozen copy of questions.hotness.hot_score with the settings of its time, later formulas
+# and settings are applied by recompute_hot_scores
+HOT_EPOCH = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+HOT_DECAY = 45000
+HOT_ANSWER_WEIGHT = 0.5
+
+
+def hot_score(rank, answer_count, date_pub):
+    sign = (rank > 0) - (rank < 0)
+    votes = sign * math.log10(max(abs(rank), 1))
+    answers = HOT_ANSWER_WEIGHT * math.log10(1 + answer_count)
+    return round(votes + answers + (date_pub - HOT_EPOCH).total_seconds() / HOT_DECAY, 7)
+
+
+def backfill_hot_scores(apps, schema_editor):
+    Question = apps.get_model('questions', 'Question')
+    last_pk = 0
+    while True:
+        questions = list(Question.objects.filter(pk__gt=last_pk).order_by('pk').
+                         only('pk', 'rank', 'answer_count', 'date_pub')[:1000])
+        if not questions:
+            break
+        for question in questions:
+            question.hot_score = hot_score(question.rank, question.answer_count, question.date_pub)
+        Question.objects.bulk_update(questions, ['hot_score'])
+        last_pk = questions[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0007_tagstats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='question',
+            name='question_trending_idx',
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='hot_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['-hot_score', '-date_pub'], name='question_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['last_activity'], name='question_activity_idx'),
+        ),
+        migrations.RunPython(backfill_hot_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:15
+
+import logging
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+
+
+def copy_votes(apps, schema_editor):
+    """
+    Move the question and answer rows of the generic votes table to the typed tables.
+    Votes of deleted objects, which the generic table allows, are dropped.
+    """
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Vote = apps.get_model('votes', 'Vote')
+    for model_name, vote_model_name in (('question', 'QuestionVote'), ('answer', 'AnswerVote')):
+        content_type = ContentType.objects.filter(app_label='questions', model=model_name).first()
+        if content_type is None:
+            continue
+        model = apps.get_model('questions', model_name)
+        vote_model = apps.get_model('questions', vote_model_name)
+        votes = Vote.objects.filter(content_type=content_type).order_by('pk')
+        last_pk = orphans = 0
+        while True:
+            batch = list(votes.filter(pk__gt=last_pk).values_list('pk', 'object_id', 'user_id', 'vote')[:BATCH_SIZE])
+            if not batch:
+                break
+            existing = set(model.objects.filter(pk__in={row[1] for row in batch}).values_list('pk', flat=True))
+            vote_model.objects.bulk_create([vote_model(target_id=object_id, user_id=user_id, vote=vote)
+                                            for _, object_id, user_id, vote in batch if object_id in existing])
+            orphans += sum(1 for row in batch if row[1] not in existing)
+            last_pk = batch[-1][0]
+            Vote.objects.filter(content_type=content_type, pk__lte=last_pk).delete()
+        if orphans:
+            logger.warning('Dropped %d votes of deleted %ss', orphans, model_name)
+
+
+def restore_votes(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Vote = apps.get_model('votes', 'Vote')
+    for model_name, vote_model_name in (('question', 'QuestionVote'), ('answer', 'AnswerVote')):
+        vote_model = apps.get_model('questions', vote_model_name)
+        if not vote_model.objects.exists():
+            continue
+        content_type, _ = ContentType.objects.get_or_create(app_label='questions', model=model_name)
+        last_pk = 0
+        while True:
+            batch = list(vote_model.objects.filter(pk__gt=last_pk).order_by('pk').
+                         values_list('pk', 'target_id', 'user_id', 'vote')[:BATCH_SIZE])
+            if not batch:
+                break
+            Vote.objects.bulk_create([Vote(content_type=content_type, object_id=target_id, user_id=user_id, vote=vote)
+                                      for _, target_id, user_id, vote in batch])
+            last_pk = batch[-1][0]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('votes', '0002_hot_query_indexes'),
+        ('questions', '0008_question_hot_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionVote',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('vote', models.SmallIntegerField(choices=[(1, 'Vote Up'), (-1, 'Vote Down')])),
+                ('target', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='votes', to='questions.question')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                           to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnswerVote',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('vote', models.SmallIntegerField(choices=[(1, 'Vote Up'), (-1, 'Vote Down')])),
+                ('target', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE,
+                                             related_name='votes', to='questions.answer')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+',
+                                           to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='questionvote',
+            constraint=models.UniqueConstraint(fields=('target', 'user'), name='unique_question_vote'),
+        ),
+        migrations.AddConstraint(
+            model_name='answervote',
+            constraint=models.UniqueConstraint(fields=('target', 'user'), name='unique_answer_vote'),
+        ),
+        migrations.RunPython(copy_votes, restore_votes),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0009_typed_votes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSearchIndex',
+            fields=[
+                ('question', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='questions.question')),
+                ('title', models.TextField()),
+                ('content', models.TextField()),
+            ],
+            options={
+                'db_table': 'questions_question_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('questions', '0010_questionsearchindex'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answernotification',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+    ]
@@ -1,14 +1,17 @@
 from django.db import models
 from django.urls import reverse_lazy
+from django.utils import timezone
 
 from users.models import UserProfile
-from votes.models import RankedVoteModel
-from .managers import QuestionRelationsManager
+from votes.models import RankedVoteModel, TargetVote
+from .managers import QuestionRelationsManager, TagManager
 
 
 class Tag(models.Model):
     name = models.CharField(max_length=30, unique=True)
 
+    objects = TagManager()
+
     def __str__(self):
         return self.name
 
@@ -19,12 +22,22 @@ class Question(RankedVoteModel):
     date_pub = models.DateTimeField(auto_now_add=True)
     user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='questions')
     tags = models.ManyToManyField(Tag, blank=True)
+    answer_count = models.PositiveIntegerField(default=0, editable=False)
+    # see questions.hotness, recomputed by `manage.py recompute_hot_scores` for recently active questions
+    hot_score = models.FloatField(default=0, editable=False)
+    last_activity = models.DateTimeField(default=timezone.now, editable=False)
 
     objects = models.Manager()
     objects_related = QuestionRelationsManager()
 
     class Meta:
         ordering = ['-date_pub']
+        indexes = [
+            models.Index(fields=['-date_pub'], name='question_date_pub_idx'),
+            models.Index(fields=['-rank', '-date_pub'], name='question_rank_idx'),
+            models.Index(fields=['-hot_score', '-date_pub'], name='question_hot_idx'),
+            models.Index(fields=['last_activity'], name='question_activity_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -32,6 +45,26 @@ class Question(RankedVoteModel):
     def get_absolute_url(self):
         return reverse_lazy('questions:detail', args=[self.pk])
 
+    @classmethod
+    def rank_update_fields(cls):
+        # a vote makes the question active, see questions.hotness
+        return {'last_activity': timezone.now()}
+
+
+class QuestionSearchIndex(models.Model):
+    """
+    The SQLite FTS5 table of questions.search, unmanaged: it is created by migration 0003.
+    Mapped only to be joined by the search queries.
+    """
+    question = models.OneToOneField(Question, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+                                    related_name='search_index')
+    title = models.TextField()
+    content = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'questions_question_fts'
+
 
 class Answer(RankedVoteModel):
     question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='answers', default=None)
@@ -42,7 +75,84 @@ class Answer(RankedVoteModel):
 
     class Meta:
         ordering = ['-date_pub']
+        indexes = [
+            models.Index(fields=['-date_pub'], name='answer_date_pub_idx'),
+            models.Index(fields=['question', '-rank', '-date_pub'], name='answer_question_rank_idx'),
+        ]
 
     def __str__(self):
         return self.content
-    
\ No newline at end of file
+
+
+class QuestionVote(TargetVote):
+    # the unique (target, user) key serves the lookups by target
+    target = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='votes', db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['target', 'user'], name='unique_question_vote'),
+        ]
+
+
+class AnswerVote(TargetVote):
+    # the unique (target, user) key serves the lookups by target
+    target = models.ForeignKey(Answer, on_delete=models.CASCADE, related_name='votes', db_index=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['target', 'user'], name='unique_answer_vote'),
+        ]
+
+
+class TagStats(models.Model):
+    """
+    Materialized per-tag statistics maintained by the questions signals
+    """
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    question_count = models.PositiveIntegerField(default=0)
+    last_activity = models.DateTimeField(null=True, blank=True)
+    top_questions = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-question_count'], name='tagstats_question_count_idx'),
+        ]
+
+    def __str__(self):
+        return '%s (%d)' % (self.tag_id, self.question_count)
+
+
+class AnswerNotification(models.Model):
+    """
+    Outbound "new answer" email waiting to be sent by the send_notifications worker.
+    Answers posted to a question while its notification is pending are merged into it.
+    """
+    STATUS_PENDING = 'pending'
+    # leased by a worker until send_after, new answers are not merged into it anymore
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    )
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='notifications')
+    answer = models.ForeignKey(Answer, on_delete=models.SET_NULL, null=True, related_name='+')
+    answer_count = models.PositiveIntegerField(default=1)
+    question_link = models.URLField(max_length=512)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    send_after = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return 'Notification about %s' % self.question
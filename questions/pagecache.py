@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_response_headers
+from django.utils.http import http_date
+
+from otus_django.instrumentation import record_cache
+from .cache import bump_versions
+
+LIST_VERSION_KEY = 'questions:page:version:list'
+DETAIL_VERSION_KEY = 'questions:page:version:detail:%s'
+PAGE_CACHE_KEY = 'questions:page:%s'
+PAGE_LOCK_KEY = 'questions:page:lock:%s'
+
+CACHED_QUERY_PARAMS = ('order_by', 'page', 'cursor', 's', 't')
+
+
+def list_version_key(request, **kwargs):
+    return LIST_VERSION_KEY
+
+
+def detail_version_key(request, pk, **kwargs):
+    return DETAIL_VERSION_KEY % pk
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def page_version_keys(question_pks=(), lists=True):
+    keys = [DETAIL_VERSION_KEY % pk for pk in question_pks if pk]
+    if lists:
+        keys.append(LIST_VERSION_KEY)
+    return keys
+
+
+def invalidate_pages(question_pks=(), lists=True):
+    """
+    Mark the cached list pages and the detail pages of the given questions as stale
+    once the transaction commits
+    """
+    bump_versions(page_version_keys(question_pks, lists))
+
+
+def get_page_key(request):
+    query = sorted((key, value) for key in CACHED_QUERY_PARAMS
+                   for value in request.GET.getlist(key) if value)
+    raw = '%s?%s' % (request.path, '&'.join('%s=%s' % item for item in query))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def is_cacheable_request(request):
+    return request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def is_cacheable_response(request, response):
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and not request.META.get('CSRF_COOKIE_USED'))
+
+
+def build_entry(response, version):
+    content = response.content
+    return {
+        'version': version,
+        'content': content,
+        'content_type': response['Content-Type'],
+        'etag': '"%s"' % hashlib.md5(content).hexdigest(),
+        'last_modified': int(time.time()),
+        'fresh_until': time.time() + settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
+def entry_response(request, entry):
+    response = get_conditional_response(request, etag=entry['etag'], last_modified=entry['last_modified'])
+    if response is None:
+        response = HttpResponse(entry['content'], content_type=entry['content_type'])
+    response['ETag'] = entry['etag']
+    response['Last-Modified'] = http_date(entry['last_modified'])
+    patch_response_headers(response, max(0, int(entry['fresh_until'] - time.time())))
+    return response
+
+
+class CachedPage:
+    """
+    Cache entry of one page for one request, see cache_anonymous_page
+    """
+
+    def __init__(self, request, version_key, kwargs):
+        self.request = request
+        page_key = get_page_key(request)
+        self.cache_key = PAGE_CACHE_KEY % page_key
+        self.lock_key = PAGE_LOCK_KEY % page_key
+        self.version = get_version(version_key(request, **kwargs))
+        self.locked = False
+
+    @classmethod
+    def open(cls, request, version_key, kwargs):
+        if not settings.PAGE_CACHE_ENABLED or not is_cacheable_request(request):
+            return None
+        return cls(request, version_key, kwargs)
+
+    def lookup(self):
+        """
+        Return the fresh page, or the stale one while somebody else is rendering it.
+        Returns None when the page has to be rendered, by us if we got the lock.
+        """
+        entry = cache.get(self.cache_key)
+        if entry and entry['version'] == self.version and entry['fresh_until'] > time.time():
+            record_cache('pages', hits=1)
+            return entry_response(self.request, entry)
+        self.locked = cache.add(self.lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT)
+        if not self.locked and entry:
+            # a stale copy counts as a hit, the page isn't rendered
+            record_cache('pages', hits=1)
+            return entry_response(self.request, entry)
+        record_cache('pages', misses=1)
+
+    def poll(self):
+        entry = cache.get(self.cache_key)
+        if entry and entry['version'] == self.version:
+            return entry_response(self.request, entry)
+
+    def store(self, response):
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        if is_cacheable_response(self.request, response):
+            entry = build_entry(response, self.version)
+            cache.set(self.cache_key, entry, settings.PAGE_CACHE_TIMEOUT + settings.PAGE_CACHE_STALE_TIMEOUT)
+            return entry_response(self.request, entry)
+        return response
+
+    def release(self):
+        cache.delete(self.lock_key)
+
+
+def cache_anonymous_page(version_key):
+    """
+    Full page cache for anonymous users.
+
+    Pages are keyed by path and the normalized query string and stored with the
+    version of their scope (see version_key), bumping the version marks them stale.
+    Stale or expired pages are regenerated by a single request holding a lock
+    while concurrent requests get the stale copy. Without one, async views wait
+    briefly for the new page and sync views render it themselves.
+    Works for both sync and async views.
+    """
+
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapped(request, *args, **kwargs):
+                page = await sync_to_async(CachedPage.open)(request, version_key, kwargs)
+                if page is None:
+                    return await view_func(request, *args, **kwargs)
+                response = await sync_to_async(page.lookup)()
+                if response is not None:
+                    return response
+
+                if not page.locked:
+                    deadline = time.monotonic() + settings.PAGE_CACHE_LOCK_WAIT
+                    while time.monotonic() < deadline:
+                        await asyncio.sleep(0.05)
+                        response = await sync_to_async(page.poll)()
+                        if response is not None:
+                            return response
+                    return await view_func(request, *args, **kwargs)
+
+                try:
+                    response = await view_func(request, *args, **kwargs)
+                    return await sync_to_async(page.store)(response)
+                finally:
+                    await sync_to_async(page.release)()
+
+            return async_wrapped
+
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            page = CachedPage.open(request, version_key, kwargs)
+            if page is None:
+                return view_func(request, *args, **kwargs)
+            response = page.lookup()
+            if response is not None:
+                return response
+
+            if not page.locked:
+                # somebody else is rendering this page and there is no stale copy, render it too
+                # rather than holding a worker thread while waiting for theirs
+                return view_func(request, *args, **kwargs)
+
+            try:
+                return page.store(view_func(request, *args, **kwargs))
+            finally:
+                page.release()
+
+        return wrapped
+
+    return decorator
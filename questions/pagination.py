@@ -0,0 +1,204 @@
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage, Paginator
+from django.db import models
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from otus_django.instrumentation import record_cache
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage:
+    """
+    Page of a CursorPaginator, mirrors the parts of django Page used by templates
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Cursor page of %d objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator.
+
+    Pages are addressed by opaque cursors holding the ordering values of the
+    first/last row of the neighbour page, so every page is a single indexed
+    range scan without COUNT(*) or OFFSET. The ordering must be unique,
+    'pk' is appended when missing.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        ordering = list(ordering or queryset.query.order_by or queryset.model._meta.ordering)
+        if 'pk' not in ordering and '-pk' not in ordering:
+            ordering.append('pk')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    @property
+    def count(self):
+        """
+        Approximate total number of objects, cached for QUESTIONS_COUNT_CACHE_TIMEOUT seconds
+        """
+        key = 'pagination:count:%s' % hashlib.md5(str(self.queryset.query).encode()).hexdigest()
+        count = cache.get(key)
+        record_cache('pagination_count', hits=count is not None, misses=count is None)
+        if count is None:
+            count = self.queryset.order_by().count()
+            cache.set(key, count, settings.QUESTIONS_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def _field(self, name):
+        if name == 'pk':
+            return self.queryset.model._meta.pk
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def _values(self, obj):
+        values = []
+        for name, _ in self.fields:
+            value = getattr(obj, name)
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def encode_cursor(self, obj, direction):
+        payload = json.dumps([direction, self._values(obj)], separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(payload)
+        except (ValueError, TypeError, binascii.Error):
+            raise InvalidCursor('Invalid cursor')
+        if direction not in ('next', 'prev') or not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor('Invalid cursor')
+        decoded = []
+        for (name, _), value in zip(self.fields, values):
+            if isinstance(self._field(name), models.DateTimeField):
+                value = parse_datetime(value) if isinstance(value, str) else None
+                if value is None:
+                    raise InvalidCursor('Invalid cursor')
+            decoded.append(value)
+        return direction, decoded
+
+    def _seek(self, values, forward):
+        """
+        Q selecting the rows strictly after (forward) or before the given ordering values
+        """
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self.fields, values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{'%s__%s' % (name, lookup): value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        if not cursor:
+            direction, values = 'next', None
+        else:
+            direction, values = self.decode_cursor(cursor)
+        forward = direction == 'next'
+
+        ordering = self.ordering if forward else [name[1:] if name.startswith('-') else '-' + name
+                                                  for name in self.ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._seek(values, forward))
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if not forward:
+            object_list.reverse()
+
+        next_cursor = previous_cursor = None
+        if object_list:
+            if has_more or not forward:
+                next_cursor = self.encode_cursor(object_list[-1], 'next')
+            if values is not None and (forward or has_more):
+                previous_cursor = self.encode_cursor(object_list[0], 'prev')
+        return CursorPage(object_list, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    Switches a ListView to keyset pagination when QUESTIONS_CURSOR_PAGINATION is on,
+    the cursor is read from the 'cursor' GET parameter
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        if not settings.QUESTIONS_CURSOR_PAGINATION:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
+class TagPaginator(Paginator):
+    """
+    Paginator of the questions of a single tag, the total comes from the tag stats
+    instead of COUNT(*) and the first page from the precomputed top questions
+    """
+
+    def __init__(self, object_list, per_page, stats, **kwargs):
+        super(TagPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.stats = stats
+
+    @cached_property
+    def count(self):
+        return self.stats.question_count
+
+    def page(self, number):
+        number = self.validate_number(number)
+        top = [pk for pk, _ in self.stats.top_questions]
+        if number == 1 and top and len(top) >= min(self.per_page, self.count):
+            object_list = list(self.object_list.filter(pk__in=top[:self.per_page]))
+            return self._get_page(object_list, number, self)
+        return super(TagPaginator, self).page(number)
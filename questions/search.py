@@ -0,0 +1,100 @@
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import QuestionSearchIndex
+
+FTS_TABLE = QuestionSearchIndex._meta.db_table
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchBackend(ABC):
+    """
+    Interface of the question search backends.
+
+    search() narrows and orders a Question queryset, index() and remove()
+    keep the backend in sync and are called on every question save/delete.
+    """
+
+    @abstractmethod
+    def search(self, queryset, query):
+        pass
+
+    def index(self, question):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self, queryset):
+        pass
+
+
+class ContainsSearchBackend(SearchBackend):
+    """
+    Database agnostic fallback, scans title and content with LIKE
+    """
+
+    def search(self, queryset, query):
+        return queryset.filter(Q(title__contains=query) | Q(content__contains=query)). \
+            order_by('-rank', '-date_pub')
+
+
+class SQLiteFTSSearchBackend(SearchBackend):
+    """
+    SQLite FTS5 inverted index over title and content ranked with bm25
+    """
+    title_weight = 10.0
+    content_weight = 1.0
+
+    def match_expression(self, query):
+        terms = TERM_RE.findall(query.lower())
+        return ' '.join('"%s"' % term for term in terms)
+
+    def search(self, queryset, query):
+        match = self.match_expression(query)
+        if not match:
+            return queryset.none()
+        # the index is joined: bm25() is computed once per match, a correlated
+        # subquery would run the whole full text query again for every row.
+        # bm25() is negative, the better the match the lower the score
+        return queryset.filter(search_index__isnull=False). \
+            annotate(search_score=RawSQL('bm25({fts}, %s, %s)'.format(fts=FTS_TABLE),
+                                        (self.title_weight, self.content_weight), output_field=FloatField())). \
+            filter(RawSQL('{fts} MATCH %s'.format(fts=FTS_TABLE), (match,), output_field=BooleanField())). \
+            order_by('search_score', '-rank', '-date_pub')
+
+    def index(self, question):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {fts} WHERE rowid = %s'.format(fts=FTS_TABLE), [question.pk])
+            cursor.execute('INSERT INTO {fts} (rowid, title, content) VALUES (%s, %s, %s)'.format(fts=FTS_TABLE),
+                           [question.pk, question.title, question.content])
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {fts} WHERE rowid = %s'.format(fts=FTS_TABLE), [pk])
+
+    def rebuild(self, queryset):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM {fts}'.format(fts=FTS_TABLE))
+            cursor.executemany('INSERT INTO {fts} (rowid, title, content) VALUES (%s, %s, %s)'.format(fts=FTS_TABLE),
+                               queryset.values_list('pk', 'title', 'content').iterator())
+
+
+BACKENDS_BY_VENDOR = {
+    'sqlite': 'questions.search.SQLiteFTSSearchBackend',
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    path = settings.QUESTIONS_SEARCH_BACKEND or \
+        BACKENDS_BY_VENDOR.get(connection.vendor, 'questions.search.ContainsSearchBackend')
+    return import_string(path)()
@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from otus_django.events import broker
+from votes.signals import rank_changed
+from .autocomplete import add_tags
+from .cache import affects_trending, invalidate_trending, bump_card_version, bump_versions, card_version_keys
+from .models import Question, Answer, Tag
+from .pagecache import invalidate_pages, page_version_keys
+from .search import get_search_backend
+from . import hotness, tagstats
+
+
+@receiver(rank_changed, sender=Question)
+def question_rank_changed(sender, pk, rank, delta, **kwargs):
+    if pk is not None:
+        publish_rank('question:%s' % pk, 'question', pk, rank)
+    if affects_trending(pk, rank, delta):
+        invalidate_trending()
+    if pk is None:
+        tagstats.question_rank_changed(pk, rank)
+        invalidate_pages()
+        return
+    # last_activity is set by the rank UPDATE itself. The first page of a tag listing is
+    # served from the tag top lists, those the new rank changes are refreshed after the
+    # commit so later pages, queried live, don't drift from it. Cached list pages are kept,
+    # their order catches up once they expire after PAGE_CACHE_TIMEOUT
+    transaction.on_commit(lambda: tagstats.question_rank_changed(pk, rank))
+    bump_versions(card_version_keys([pk]) + page_version_keys([pk], lists=False))
+
+
+@receiver(rank_changed, sender=Answer)
+def answer_rank_changed(sender, pk, rank, delta, **kwargs):
+    if pk is None:
+        invalidate_pages()
+        return
+    question_ids = list(Answer.objects.filter(pk=pk).values_list('question_id', flat=True))
+    invalidate_pages(question_ids, lists=False)
+    for question_id in question_ids:
+        publish_rank('question:%s' % question_id, 'answer', pk, rank)
+
+
+def publish_rank(topic, model_name, pk, rank):
+    broker.publish_on_commit(topic, '%s:%s' % (model_name, pk), rank=rank)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def question_changed(sender, instance, created=False, **kwargs):
+    if created:
+        hotness.question_created(instance)
+    if affects_trending(instance.pk, instance.rank, hot_score=instance.hot_score):
+        invalidate_trending()
+    bump_card_version(instance.pk)
+    invalidate_pages([instance.pk])
+
+
+@receiver(post_save, sender=Question)
+def index_question(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'title', 'content'} & set(update_fields):
+        return
+    get_search_backend().index(instance)
+
+
+@receiver(post_delete, sender=Question)
+def unindex_question(sender, instance, **kwargs):
+    get_search_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Answer)
+def answer_created(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.question_id). \
+            update(answer_count=F('answer_count') + 1, last_activity=timezone.now())
+        bump_card_version(instance.question_id)
+    invalidate_pages([instance.question_id], lists=created)
+
+
+@receiver(post_delete, sender=Answer)
+def answer_deleted(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id, answer_count__gt=0). \
+        update(answer_count=F('answer_count') - 1, last_activity=timezone.now())
+    bump_card_version(instance.question_id)
+    invalidate_pages([instance.question_id])
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    Tag.objects.id_cache.discard(instance.name)
+
+
+@receiver(pre_save, sender=Tag)
+def tag_renaming(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_name = Tag.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Tag)
+def tag_created(sender, instance, created, **kwargs):
+    if created:
+        add_tags([instance.name])
+    previous_name = getattr(instance, '_previous_name', None)
+    if previous_name and previous_name != instance.name:
+        # both names may be cached, the old one with this id, the new one with a deleted tag's
+        Tag.objects.id_cache.discard(previous_name)
+        Tag.objects.id_cache.discard(instance.name)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def question_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        instance._cleared_pks = set(getattr(instance, 'question_set' if reverse else 'tags').
+                                    values_list('pk', flat=True))
+        return
+    if action == 'post_clear':
+        pk_set = instance.__dict__.pop('_cleared_pks', set())
+    elif action not in ('post_add', 'post_remove'):
+        return
+    if not pk_set:
+        return
+    if reverse:
+        tag_ids, count = [instance.pk], len(pk_set)
+        bump_card_version(*pk_set)
+        invalidate_pages(pk_set)
+    else:
+        tag_ids, count = pk_set, 1
+        bump_card_version(instance.pk)
+        invalidate_pages([instance.pk])
+    if action == 'post_add':
+        tagstats.tags_added(tag_ids, count)
+    else:
+        tagstats.tags_removed(tag_ids, count)
+
+
+@receiver(pre_delete, sender=Question)
+def question_deleting(sender, instance, **kwargs):
+    instance._deleted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    tag_ids = instance.__dict__.pop('_deleted_tag_ids', None)
+    if tag_ids:
+        tagstats.tags_removed(tag_ids)
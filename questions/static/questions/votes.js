@@ -0,0 +1,37 @@
+(function () {
+    // votes in place through the JSON vote API, the links of the votes widget keep working without it
+    if (window.votesEnhanced || !window.fetch) {
+        return;
+    }
+    window.votesEnhanced = true;
+    var csrfToken = (document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/) || [])[1];
+    document.addEventListener('click', function (event) {
+        var link = event.target.closest && event.target.closest('[data-votes] a[data-vote]');
+        if (!link || !csrfToken) {
+            return;
+        }
+        event.preventDefault();
+        fetch(link.href, {
+            method: 'POST',
+            headers: {'X-CSRFToken': decodeURIComponent(csrfToken)},
+            credentials: 'same-origin',
+            redirect: 'manual'
+        }).then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.json();
+        }).then(function (data) {
+            var widget = link.closest('[data-votes]');
+            widget.querySelector('[data-counter]').textContent = data.rank;
+            widget.querySelectorAll('a[data-vote]').forEach(function (a) {
+                var direction = a.getAttribute('data-vote') > 0 ? 'up' : 'down';
+                a.className = 'text-decoration-none ' + data.state[direction + '_class'];
+                a.title = data.state[direction + '_title'];
+            });
+        }).catch(function () {
+            // anonymous users get the login redirect of the plain link
+            window.location.href = link.href;
+        });
+    });
+})();
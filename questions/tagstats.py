@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Question, Tag, TagStats
+
+QuestionTag = Question.tags.through
+
+
+def top_questions(tag_id):
+    """
+    [pk, rank] of the best ranked questions of a tag, in the QuestionSearch ordering
+    """
+    return [list(row) for row in Question.objects.filter(tags=tag_id).order_by('-rank', '-date_pub').
+            values_list('pk', 'rank')[:settings.QUESTIONS_PER_PAGE]]
+
+
+def refresh_top_questions(tag_ids):
+    for tag_id in tag_ids:
+        TagStats.objects.filter(tag_id=tag_id).update(top_questions=top_questions(tag_id))
+
+
+def tags_added(tag_ids, count=1):
+    tag_ids = list(tag_ids)
+    TagStats.objects.bulk_create([TagStats(tag_id=tag_id) for tag_id in tag_ids], ignore_conflicts=True)
+    TagStats.objects.filter(tag_id__in=tag_ids). \
+        update(question_count=F('question_count') + count, last_activity=timezone.now())
+    refresh_top_questions(tag_ids)
+
+
+def tags_removed(tag_ids, count=1):
+    tag_ids = list(tag_ids)
+    TagStats.objects.filter(tag_id__in=tag_ids). \
+        update(question_count=Greatest(F('question_count') - count, 0))
+    refresh_top_questions(tag_ids)
+
+
+def question_rank_changed(pk, rank):
+    """
+    Refresh the top questions of the tags where the new rank may change the top list
+    """
+    if pk is None:
+        refresh_top_questions(TagStats.objects.values_list('tag_id', flat=True))
+        return
+    stale = []
+    stats = TagStats.objects.filter(tag__in=QuestionTag.objects.filter(question_id=pk).values('tag_id'))
+    for tag_id, top in stats.values_list('tag_id', 'top_questions'):
+        listed = any(top_pk == pk for top_pk, _ in top)
+        if rank is None or listed or len(top) < settings.QUESTIONS_PER_PAGE or rank >= top[-1][1]:
+            stale.append(tag_id)
+    refresh_top_questions(stale)
+
+
+def refresh_active_tags(since=None):
+    """
+    Refresh the top questions of the tags of the questions active since the given time,
+    of all tags when it's None. Votes leave the top lists to this periodic refresh.
+    """
+    tag_ids = TagStats.objects.values_list('tag_id', flat=True)
+    if since is not None:
+        tag_ids = QuestionTag.objects.filter(question__last_activity__gte=since). \
+            values_list('tag_id', flat=True).distinct()
+    refresh_top_questions(list(tag_ids))
+
+
+def rebuild_tag_stats():
+    now = timezone.now()
+    counts = Tag.objects.annotate(count=Count('question')).values_list('pk', 'count')
+    TagStats.objects.all().delete()
+    TagStats.objects.bulk_create([TagStats(tag_id=pk, question_count=count, last_activity=now)
+                                  for pk, count in counts], batch_size=1000)
+    refresh_top_questions(TagStats.objects.filter(question_count__gt=0).values_list('tag_id', flat=True))
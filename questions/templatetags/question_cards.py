@@ -0,0 +1,41 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+from otus_django.instrumentation import record_cache
+from questions.cache import CARD_CACHE_KEY, get_card_versions
+
+register = template.Library()
+
+# the author block (avatar, name, timesince) is rendered per request into the shared fragment
+AUTHOR_MARKER = '<!-- question-author -->'
+
+
+@register.simple_tag(takes_context=True)
+def question_cards(context, questions):
+    """
+    Render the question cards from fragments shared by all users,
+    the author block is filled in per request
+    """
+    questions = list(questions)
+    versions = get_card_versions([question.pk for question in questions])
+    keys = {question.pk: CARD_CACHE_KEY % (question.pk, versions[question.pk]) for question in questions}
+    fragments = cache.get_many(keys.values())
+    record_cache('question_cards', hits=len(fragments), misses=len(keys) - len(fragments))
+
+    rendered = {}
+    for question in questions:
+        if keys[question.pk] not in fragments:
+            html = render_to_string('questions/include/question_card.html',
+                                    {'question': question, 'author': mark_safe(AUTHOR_MARKER)})
+            fragments[keys[question.pk]] = rendered[keys[question.pk]] = html
+    if rendered:
+        cache.set_many(rendered, settings.QUESTION_CARD_CACHE_TIMEOUT)
+
+    author = get_template('questions/include/user_asked.html')
+    output = []
+    for question in questions:
+        output.append(fragments[keys[question.pk]].replace(AUTHOR_MARKER, author.render({'question': question})))
+    return mark_safe(''.join(output))
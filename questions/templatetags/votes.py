@@ -1,11 +1,26 @@
 from django import template
 
+from votes.utils import get_vote_state
+
 register = template.Library()
 
 
 @register.simple_tag(takes_context=True)
 def is_user_voted_for(context, model_name, model_pk, vote):
     votes = context.get('votes')
-    # return votes.get(model_name).get(model_pk)
-    
-    return vote
+    if votes is None:
+        return False
+    votes.prime(context)
+    return votes.get(model_name, model_pk) == vote
+
+
+@register.simple_tag(takes_context=True)
+def vote_state(context, model_name, model_pk):
+    """
+    State of the vote links for the current user
+    """
+    votes = context.get('votes')
+    if votes is None:
+        return get_vote_state(None)
+    votes.prime(context)
+    return get_vote_state(votes.get(model_name, model_pk))
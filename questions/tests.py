@@ -1,3 +1,999 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.http import Http404, HttpResponse
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from otus_django.events import broker, drain, merge_events, with_events
+from otus_django.instrumentation import InstrumentationMiddleware, InstrumentedDjangoTemplates, metrics_view, \
+    view_metrics
+from users.models import UserProfile
+from votes.models import Vote
+from .cache import TRENDING_CACHE_KEY, get_trending
+from .models import Question, Answer, Tag, TagStats, AnswerNotification
+from .pagecache import cache_anonymous_page, detail_version_key, LIST_VERSION_KEY, PAGE_LOCK_KEY, get_page_key, \
+    get_version
+from .pagination import CursorPaginator, InvalidCursor, TagPaginator
+from .autocomplete import SNAPSHOT_CACHE_KEY, build_snapshot, reset_tag_index
+from .forms import QuestionAddForm
+from .hotness import hot_score, recompute_hot_scores
+from .management.commands.benchmark_endpoints import find_regressions
+from .search import get_search_backend
+from .utils import claim_due_notifications, queue_email_about_new_answer, send_due_notifications
+from .views import QuestionList, QuestionSearch, question_detail, question_list
+from .votes import UserVotes
+
+
+def create_user(username):
+    return UserProfile.objects.create(username=username, email='%s@example.com' % username)
+
+
+class TrendingCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+
+    def test_trending_is_cached(self):
+        """
+        The trending list is computed once and then served from the cache.
+        """
+        self.assertEqual(get_trending(), [])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_trending(), [])
+
+    def test_vote_invalidates_trending(self):
+        """
+        A question whose rank enters the trending list drops the cached list.
+        """
+        get_trending()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_UP)
+        self.assertIsNone(cache.get(TRENDING_CACHE_KEY))
+        self.assertEqual([(question['pk'], question['rank']) for question in get_trending()],
+                         [(self.question.pk, 1)])
+
+    def test_vote_below_threshold_keeps_trending(self):
+        """
+        A rank change that can't reach the trending list keeps the cache.
+        """
+        get_trending()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_DOWN)
+        self.assertEqual(cache.get(TRENDING_CACHE_KEY), [])
+
+    def test_vote_below_hot_scores_keeps_trending(self):
+        """
+        A vote of a question already eligible for the list keeps the cache, as hot scores
+        only change with recompute_hot_scores.
+        """
+        other = create_user('other')
+        self.question.vote(other, Vote.VOTE_UP)
+        listed = [Question.objects.create(title='Listed', content='Content', user=self.user, rank=5)
+                  for _ in range(settings.QUESTIONS_PER_PAGE)]
+        self.assertEqual([question['pk'] for question in get_trending()],
+                         [question.pk for question in reversed(listed)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_UP)
+        self.assertIsNotNone(cache.get(TRENDING_CACHE_KEY))
+
+
+class UserVotesTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+        self.answers = [Answer.objects.create(question=self.question, content='Answer', user=self.user)
+                        for _ in range(3)]
+        self.question.vote(self.user, Vote.VOTE_UP)
+        self.answers[1].vote(self.user, Vote.VOTE_DOWN)
+
+    def test_page_votes_are_fetched_in_one_query(self):
+        """
+        Votes of the rendered answers are resolved with a single query.
+        """
+        votes = UserVotes(self.user)
+        votes.prime({'page_obj': self.answers})
+        with self.assertNumQueries(1):
+            resolved = [votes.get('answer', answer.pk) for answer in self.answers]
+        self.assertEqual(resolved, [None, Vote.VOTE_DOWN, None])
+
+    def test_unregistered_object(self):
+        """
+        Objects that weren't registered up front are fetched on lookup, unknown models are ignored.
+        """
+        votes = UserVotes(self.user)
+        self.assertEqual(votes.get('question', self.question.pk), Vote.VOTE_UP)
+        self.assertIsNone(votes.get('tag', 1))
+
+    def test_anonymous_user(self):
+        """
+        Anonymous users never hit the votes table.
+        """
+        votes = UserVotes(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertIsNone(votes.get('question', self.question.pk))
+
+
+class QuestionSearchTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.title_match = Question.objects.create(title='Django signals', content='How do they work?',
+                                                   user=self.user)
+        self.content_match = Question.objects.create(title='Hooks', content='Are django signals slow?',
+                                                     user=self.user)
+        self.other = Question.objects.create(title='Python', content='Generators', user=self.user)
+
+    def search(self, query):
+        return list(get_search_backend().search(Question.objects.all(), query))
+
+    def test_multi_term_ranking(self):
+        """
+        All terms must match and title matches rank above content matches.
+        """
+        self.assertEqual(self.search('signals django'), [self.title_match, self.content_match])
+        self.assertEqual(self.search('django generators'), [])
+
+    def test_index_follows_edits(self):
+        """
+        Saving and deleting questions keeps the index up to date.
+        """
+        self.other.title = 'Django generators'
+        self.other.save()
+        self.assertEqual(self.search('generators'), [self.other])
+        self.other.delete()
+        self.assertEqual(self.search('generators'), [])
+
+    def test_query_syntax_is_escaped(self):
+        """
+        FTS operators typed by users are treated as plain text.
+        """
+        self.assertEqual(self.search('signals" ('), [self.title_match, self.content_match])
+        self.assertEqual(self.search('?!'), [])
+
+    def test_cursor_pages(self):
+        """
+        Search results are paged by the cursor paginator on the match score.
+        """
+        paginator = CursorPaginator(get_search_backend().search(Question.objects.all(), 'django'), 1)
+        first = paginator.page()
+        second = paginator.page(first.next_cursor)
+        self.assertEqual(list(first), [self.title_match])
+        self.assertEqual(list(second), [self.content_match])
+        self.assertFalse(second.has_next())
+        self.assertEqual(list(paginator.page(second.previous_cursor)), [self.title_match])
+
+    def test_tag_search(self):
+        """
+        The tag: syntax filters by tag name instead of searching the text.
+        """
+        self.other.tags.add(Tag.objects.create(name='python'))
+        view = QuestionSearch()
+        view.request = RequestFactory().get(reverse('questions:search'), {'s': 'tag:python'})
+        self.assertEqual(list(view.get_queryset()), [self.other])
+
+
+class AnswerCountTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+
+    def answer_count(self):
+        return Question.objects.get(pk=self.question.pk).answer_count
+
+    def test_answer_count_follows_answers(self):
+        """
+        answer_count is incremented on new answers and decremented on deletes.
+        """
+        answer = Answer.objects.create(question=self.question, content='Answer', user=self.user)
+        Answer.objects.create(question=self.question, content='Answer', user=self.user)
+        self.assertEqual(self.answer_count(), 2)
+        answer.delete()
+        self.assertEqual(self.answer_count(), 1)
+
+    def test_recompute_answer_counts(self):
+        """
+        recompute_answer_counts repairs drifted counters.
+        """
+        Answer.objects.create(question=self.question, content='Answer', user=self.user)
+        Question.objects.update(answer_count=10)
+        call_command('recompute_answer_counts', stdout=StringIO())
+        self.assertEqual(self.answer_count(), 1)
+
+
+class CursorPaginatorTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        for i in range(5):
+            Question.objects.create(title='Question %d' % i, content='Content', user=self.user, rank=i % 2)
+        self.ordered = list(Question.objects.order_by('-rank', '-date_pub', 'pk'))
+
+    def test_walk_forward_and_back(self):
+        """
+        next/prev cursors walk the keyset ordering without gaps or duplicates.
+        """
+        paginator = CursorPaginator(Question.objects.order_by('-rank', '-date_pub'), 2)
+        first = paginator.page()
+        self.assertFalse(first.has_previous())
+        second = paginator.page(first.next_cursor)
+        third = paginator.page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(third), self.ordered)
+        self.assertFalse(third.has_next())
+        self.assertEqual(list(paginator.page(third.previous_cursor)), list(second))
+        self.assertEqual(list(paginator.page(second.previous_cursor)), list(first))
+
+    def test_invalid_cursor(self):
+        """
+        Tampered cursors are rejected.
+        """
+        paginator = CursorPaginator(Question.objects.order_by('-date_pub'), 2)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('garbage')
+
+    def test_count_is_cached(self):
+        """
+        The total count is approximate and served from the cache.
+        """
+        cache.clear()
+        paginator = CursorPaginator(Question.objects.order_by('-date_pub'), 2)
+        self.assertEqual(paginator.count, 5)
+        Question.objects.create(title='Question', content='Content', user=self.user)
+        self.assertEqual(paginator.count, 5)
+
+
+class AnswerNotificationTests(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.author)
+        self.request = RequestFactory().get('/')
+
+    def answer(self):
+        answer = Answer.objects.create(question=self.question, content='Answer', user=self.user)
+        queue_email_about_new_answer(self.request, answer, self.question)
+        return answer
+
+    def make_due(self):
+        AnswerNotification.objects.update(send_after=timezone.now() - timedelta(seconds=1))
+
+    def test_answers_are_digested(self):
+        """
+        Answers posted while a notification is pending are sent as one email.
+        """
+        self.answer()
+        self.answer()
+        self.assertEqual(send_due_notifications(), (0, 0))
+        self.make_due()
+        self.assertEqual(send_due_notifications(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['author@example.com'])
+        self.assertIn('user and 1 more just answered', mail.outbox[0].body)
+        self.assertEqual(AnswerNotification.objects.get().status, AnswerNotification.STATUS_SENT)
+
+    def test_answers_are_not_merged_into_leased_notification(self):
+        """
+        An answer posted while its question's notification is being sent gets an email of its own.
+        """
+        self.answer()
+        self.make_due()
+        leased = claim_due_notifications(10)
+        self.answer()
+        self.assertEqual(AnswerNotification.objects.get(pk=leased[0].pk).answer_count, 1)
+        self.assertEqual(AnswerNotification.objects.filter(status=AnswerNotification.STATUS_PENDING).count(), 1)
+
+    def test_failed_email_is_retried_with_backoff(self):
+        """
+        A failed email is rescheduled and given up after NOTIFICATION_MAX_ATTEMPTS.
+        """
+        self.answer()
+        with self.settings(NOTIFICATION_MAX_ATTEMPTS=2), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError):
+            self.make_due()
+            self.assertEqual(send_due_notifications(), (0, 1))
+            notification = AnswerNotification.objects.get()
+            self.assertEqual(notification.status, AnswerNotification.STATUS_PENDING)
+            self.assertGreater(notification.send_after, timezone.now())
+            self.make_due()
+            self.assertEqual(send_due_notifications(), (0, 1))
+        self.assertEqual(AnswerNotification.objects.get().status, AnswerNotification.STATUS_FAILED)
+
+    def test_unreachable_server_reschedules_batch(self):
+        """
+        A connection that can't be opened reschedules the leased notifications instead of raising.
+        """
+        self.answer()
+        self.make_due()
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('refused')), \
+                self.assertLogs('questions.utils', 'ERROR'):
+            self.assertEqual(send_due_notifications(), (0, 1))
+        notification = AnswerNotification.objects.get()
+        self.assertEqual(notification.status, AnswerNotification.STATUS_PENDING)
+        self.assertEqual(notification.last_error, 'refused')
+
+    def test_expired_lease_is_given_up(self):
+        """
+        A leased notification of a crashed worker is not claimed again past NOTIFICATION_MAX_ATTEMPTS.
+        """
+        self.answer()
+        with self.settings(NOTIFICATION_MAX_ATTEMPTS=1):
+            self.make_due()
+            self.assertEqual(len(claim_due_notifications(10)), 1)
+            self.make_due()
+            self.assertEqual(claim_due_notifications(10), [])
+        self.assertEqual(AnswerNotification.objects.get().status, AnswerNotification.STATUS_FAILED)
+
+
+class TagResolutionTests(TestCase):
+
+    def setUp(self):
+        Tag.objects.id_cache.clear()
+        self.user = create_user('user')
+        self.existing = Tag.objects.create(name='django')
+
+    def test_tags_are_resolved_on_save(self):
+        """
+        Validation doesn't touch the tags table, saving resolves all tags in one batch.
+        """
+        form = QuestionAddForm({'title': 'Title', 'content': 'Content', 'tags': 'Django, python, django'})
+        with self.assertNumQueries(0):
+            self.assertTrue(form.is_valid())
+        form.instance.user = self.user
+        question = form.save()
+        self.assertEqual(sorted(question.tags.values_list('name', flat=True)), ['django', 'python'])
+
+    def test_tags_are_saved_with_save_m2m(self):
+        """
+        Saving with commit=False leaves the tags to save_m2m like any ModelForm.
+        """
+        form = QuestionAddForm({'title': 'Title', 'content': 'Content', 'tags': 'django, python'})
+        self.assertTrue(form.is_valid())
+        question = form.save(commit=False)
+        question.user = self.user
+        question.save()
+        form.save_m2m()
+        self.assertEqual(sorted(question.tags.values_list('name', flat=True)), ['django', 'python'])
+
+    def test_invalid_form_creates_no_tags(self):
+        """
+        Tags of a form that fails validation are never created.
+        """
+        form = QuestionAddForm({'title': '', 'content': 'Content', 'tags': 'new'})
+        self.assertFalse(form.is_valid())
+        self.assertFalse(Tag.objects.filter(name='new').exists())
+
+    def test_resolve_is_cached(self):
+        """
+        Known tag names are resolved without queries.
+        """
+        ids = Tag.objects.resolve(['django', 'python'])
+        self.assertEqual(ids[0], self.existing.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(Tag.objects.resolve(['python', 'django']), ids[::-1])
+
+    def test_rename_invalidates_cache(self):
+        """
+        A renamed tag is resolved by its new name only.
+        """
+        Tag.objects.lookup(['django'])
+        self.existing.name = 'django-3'
+        self.existing.save()
+        self.assertEqual(Tag.objects.lookup(['django', 'django-3']), {'django-3': self.existing.pk})
+
+
+class TagAutocompleteTests(TestCase):
+
+    def setUp(self):
+        reset_tag_index()
+        user = create_user('user')
+        popular = Tag.objects.create(name='django-orm')
+        for name in ('django', 'docker', 'python'):
+            Tag.objects.create(name=name)
+        for i in range(2):
+            Question.objects.create(title='Question', content='Content', user=user).tags.add(popular)
+        reset_tag_index()
+
+    def autocomplete(self, q, **params):
+        response = self.client.get(reverse('questions:tags_autocomplete'), dict(q=q, **params))
+        self.assertEqual(response.status_code, 200)
+        return response.json()['tags']
+
+    def test_prefix_ordered_by_weight(self):
+        """
+        Tags matching the prefix are ordered by question count, then by name.
+        """
+        self.assertEqual(self.autocomplete('d'), ['django-orm', 'django', 'docker'])
+        self.assertEqual(self.autocomplete('DJA', limit=1), ['django-orm'])
+        self.assertEqual(self.autocomplete('x'), [])
+        self.assertEqual(self.autocomplete(''), [])
+
+    def test_new_tags_are_indexed(self):
+        """
+        Tags created after the index was built are suggested right away.
+        """
+        self.autocomplete('d')
+        Tag.objects.resolve(['devops'])
+        Tag.objects.create(name='deno')
+        self.assertEqual(self.autocomplete('de'), ['deno', 'devops'])
+
+    def test_new_tags_are_merged_into_snapshot(self):
+        """
+        New tags are merged into the shared snapshot under a new version, its lifetime is kept.
+        """
+        self.autocomplete('d')
+        snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='devops')
+        merged = cache.get(SNAPSHOT_CACHE_KEY)
+        self.assertEqual(merged['weights'], dict(snapshot['weights'], devops=0))
+        self.assertNotEqual(merged['version'], snapshot['version'])
+        self.assertEqual(merged['expires_at'], snapshot['expires_at'])
+
+    def test_new_tags_dont_build_index(self):
+        """
+        Creating a tag doesn't load the index or build the snapshot on the write path.
+        """
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            Tag.objects.create(name='devops')
+        self.assertIsNone(cache.get(SNAPSHOT_CACHE_KEY))
+        self.assertEqual(self.autocomplete('de'), ['devops'])
+
+    def test_snapshot_weights_from_stats(self):
+        """
+        The snapshot takes the weights from the tag stats.
+        """
+        Question.objects.create(title='Question', content='Content', user=create_user('other')). \
+            tags.add(Tag.objects.create(name='devops'))
+        self.assertEqual(build_snapshot()['weights'], {'django-orm': 2, 'django': 0, 'docker': 0,
+                                                       'python': 0, 'devops': 1})
+
+
+class TagStatsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.tag = Tag.objects.create(name='django')
+        self.questions = [Question.objects.create(title='Question %d' % i, content='Content', user=self.user)
+                          for i in range(3)]
+        for question in self.questions:
+            question.tags.add(self.tag)
+
+    def stats(self):
+        return TagStats.objects.get(tag=self.tag)
+
+    def test_stats_follow_tagging(self):
+        """
+        question_count follows tag additions, removals and question deletes.
+        """
+        self.assertEqual(self.stats().question_count, 3)
+        self.assertIsNotNone(self.stats().last_activity)
+        self.questions[0].tags.remove(self.tag)
+        self.questions[1].delete()
+        self.assertEqual(self.stats().question_count, 1)
+        self.tag.question_set.clear()
+        self.assertEqual(self.stats().question_count, 0)
+        self.assertEqual(self.stats().top_questions, [])
+
+    def test_top_questions_follow_votes(self):
+        """
+        The top questions of a tag are reordered once the vote of a question commits.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions[0].vote(self.user, Vote.VOTE_UP)
+        self.assertEqual([pk for pk, _ in self.stats().top_questions],
+                         [self.questions[0].pk, self.questions[2].pk, self.questions[1].pk])
+
+    def test_recompute_tag_stats(self):
+        """
+        recompute_tag_stats rebuilds drifted stats.
+        """
+        TagStats.objects.update(question_count=100, top_questions=[])
+        call_command('recompute_tag_stats', stdout=StringIO())
+        self.assertEqual(self.stats().question_count, 3)
+        self.assertEqual(len(self.stats().top_questions), 3)
+
+    def test_tag_listing_fast_path(self):
+        """
+        Listing a tag counts from the stats and serves the first page from the top questions.
+        """
+        view = QuestionSearch()
+        view.request = RequestFactory().get(reverse('questions:search'), {'t': 'django'})
+        queryset = view.get_queryset()
+        paginator = view.get_paginator(queryset, 2)
+        self.assertIsInstance(paginator, TagPaginator)
+        # page query and the tags/users prefetches, no COUNT(*)
+        with self.assertNumQueries(3):
+            page = paginator.page(1)
+        self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(list(page), [self.questions[2], self.questions[1]])
+        self.assertEqual(list(paginator.page(2)), [self.questions[0]])
+        view.request = RequestFactory().get(reverse('questions:search'), {'t': 'unknown'})
+        self.assertEqual(list(view.get_queryset()), [])
+
+    def test_tag_listing_pages_follow_votes(self):
+        """
+        After a vote the fast first page and the live later pages list every question once.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self.questions[0].vote(self.user, Vote.VOTE_UP)
+        view = QuestionSearch()
+        view.request = RequestFactory().get(reverse('questions:search'), {'t': 'django'})
+        paginator = view.get_paginator(view.get_queryset(), 2)
+        listed = [question for number in paginator.page_range for question in paginator.page(number)]
+        self.assertEqual(listed, [self.questions[0], self.questions[2], self.questions[1]])
+
+
+class QuestionCardCacheTests(TestCase):
+    template = Template('{% load question_cards %}{% question_cards questions %}')
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+        self.question.tags.add(Tag.objects.create(name='django'))
+
+    def render(self, votes=None):
+        questions = list(Question.objects_related.tags().users())
+        return self.template.render(Context({'questions': questions, 'votes': votes}))
+
+    def test_cards_are_cached_until_question_changes(self):
+        """
+        Cached cards are served without queries and re-rendered after a vote.
+        """
+        html = self.render()
+        self.assertIn('django', html)
+        questions = list(Question.objects_related.tags().users())
+        with self.assertNumQueries(0):
+            self.assertEqual(self.template.render(Context({'questions': questions})), html)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_UP)
+        self.assertIn('<h5 class="mb-0">1</h5>', self.render())
+
+    def test_author_is_not_cached(self):
+        """
+        The shared fragment is reused after the author changes, the author block is not frozen in it.
+        """
+        self.render()
+        self.user.username = 'renamed'
+        self.user.save()
+        questions = list(Question.objects_related.tags().users())
+        with self.assertNumQueries(0):
+            html = self.template.render(Context({'questions': questions, 'votes': UserVotes(self.user)}))
+        self.assertIn('renamed', html)
+        self.assertIn('django', html)
+
+    @override_settings(PAGE_CACHE_ENABLED=False, TEMPLATES=[{
+        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'OPTIONS': {
+            'context_processors': ['questions.context_processors.user_votes'],
+            'loaders': [('django.template.loaders.locmem.Loader', {
+                'questions/index.html': '{% load question_cards %}{% question_cards page_obj %}',
+            }), 'django.template.loaders.app_directories.Loader'],
+        },
+    }])
+    def test_list_page(self):
+        """
+        The question list of a logged in user serves the cached cards without a votes query.
+        """
+        self.client.force_login(self.user)
+        first = self.client.get(reverse('questions:index'))
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(reverse('questions:index'))
+        self.assertEqual(first.content, second.content)
+        self.assertContains(second, 'asked')
+        self.assertFalse([query for query in queries.captured_queries if 'vote' in query['sql']])
+
+
+class AnonymousPageCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+        self.calls = 0
+
+        @cache_anonymous_page(detail_version_key)
+        def view(request, pk):
+            self.calls += 1
+            return HttpResponse('page %d' % self.calls)
+        self.view = view
+
+    def get(self, user=None, **headers):
+        request = RequestFactory().get('/%d/' % self.question.pk, {'page': '1', 'utm': 'x'}, **headers)
+        request.user = user or AnonymousUser()
+        return self.view(request, pk=self.question.pk)
+
+    def test_anonymous_pages_are_cached(self):
+        """
+        Anonymous requests are served from the cache, authenticated ones never are.
+        """
+        self.assertEqual(self.get().content, b'page 1')
+        self.assertEqual(self.get().content, b'page 1')
+        self.assertEqual(self.get(user=self.user).content, b'page 2')
+
+    def test_conditional_requests(self):
+        """
+        A matching ETag gets a 304 response.
+        """
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_new_answer_invalidates_page(self):
+        """
+        A new answer marks the question page stale.
+        """
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Answer.objects.create(question=self.question, content='Answer', user=self.user)
+        self.assertEqual(self.get().content, b'page 2')
+
+    def test_stale_page_is_served_while_regenerating(self):
+        """
+        While another request regenerates a stale page the stale copy is served.
+        """
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_UP)
+        request = RequestFactory().get('/%d/' % self.question.pk, {'page': '1'})
+        cache.add(PAGE_LOCK_KEY % get_page_key(request), 1)
+        self.assertEqual(self.get().content, b'page 1')
+        self.assertEqual(self.calls, 1)
+
+
+    def test_missing_page_is_rendered_while_locked(self):
+        """
+        Without a stale copy a sync request renders the page instead of waiting for the lock holder.
+        """
+        request = RequestFactory().get('/%d/' % self.question.pk, {'page': '1'})
+        cache.add(PAGE_LOCK_KEY % get_page_key(request), 1)
+        with mock.patch('questions.pagecache.time.sleep') as sleep:
+            self.assertEqual(self.get().content, b'page 1')
+        sleep.assert_not_called()
+
+    def test_vote_keeps_list_pages(self):
+        """
+        A vote marks the question page stale and keeps the cached list pages.
+        """
+        list_version = get_version(LIST_VERSION_KEY)
+        detail_version = get_version(detail_version_key(None, self.question.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.vote(self.user, Vote.VOTE_UP)
+        self.assertEqual(get_version(LIST_VERSION_KEY), list_version)
+        self.assertNotEqual(get_version(detail_version_key(None, self.question.pk)), detail_version)
+
+
+ASYNC_VIEW_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'context_processors': ['questions.context_processors.trending', 'questions.context_processors.user_votes'],
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'questions/index.html': '{% for question in page_obj %}{{ question.title }};{% endfor %}',
+            'questions/view.html': '{{ question.title }}:{% for answer in page_obj %}{{ answer.content }};{% endfor %}',
+        })],
+    },
+}]
+
+
+@override_settings(TEMPLATES=ASYNC_VIEW_TEMPLATES, PAGE_CACHE_ENABLED=False)
+class AsyncViewTests(TransactionTestCase):
+    # queries run in worker threads with connections of their own, so the data has to be committed
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+        self.answers = [Answer.objects.create(question=self.question, content='Answer %d' % i, user=self.user)
+                        for i in range(3)]
+
+    def get(self, view, user=None, **kwargs):
+        request = RequestFactory().get('/')
+        request.user = user or AnonymousUser()
+        return request, async_to_sync(view)(request, **kwargs)
+
+    def test_question_detail(self):
+        """
+        The async detail view renders the question with its answers.
+        """
+        request, response = self.get(question_detail, pk=self.question.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Question:', response.content)
+        for answer in self.answers:
+            self.assertIn(answer.content.encode(), response.content)
+
+    def test_question_detail_preloads_votes(self):
+        """
+        The user's votes are fetched along with the page and need no further queries.
+        """
+        self.answers[1].vote(self.user, Vote.VOTE_DOWN)
+        request, response = self.get(question_detail, user=self.user, pk=self.question.pk)
+        with self.assertNumQueries(0):
+            self.assertIsNone(request.user_votes.get('question', self.question.pk))
+            self.assertEqual(request.user_votes.get('answer', self.answers[1].pk), Vote.VOTE_DOWN)
+            self.assertIsNone(request.user_votes.get('answer', self.answers[0].pk))
+
+    def test_question_detail_not_found(self):
+        """
+        An unknown question is a 404.
+        """
+        with self.assertRaises(Http404):
+            self.get(question_detail, pk=self.question.pk + 1)
+
+    def test_question_list(self):
+        """
+        The async list view renders the questions page with the trending sidebar data.
+        """
+        Question.objects.create(title='Other', content='Content', user=self.user, rank=3)
+        request, response = self.get(question_list)
+        self.assertEqual(response.content, b'Other;Question;')
+        self.assertEqual([question['title'] for question in request.trending], ['Other'])
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_page_cache(self):
+        """
+        Async views are served from the anonymous page cache.
+        """
+        self.get(question_detail, pk=self.question.pk)
+        Answer.objects.filter(question=self.question).update(content='Changed')
+        request, response = self.get(question_detail, pk=self.question.pk)
+        self.assertIn(b'Answer 0', response.content)
+
+
+class BenchmarkToolsTests(TestCase):
+
+    def test_seed_data(self):
+        """
+        Seeded ranks and counters agree with the seeded votes and answers.
+        """
+        call_command('seed_data', users=50, questions=30, answers=90, votes=300, tags=10, batch_size=7,
+                     seed=1, stdout=StringIO())
+        self.assertEqual(Question.objects.count(), 30)
+        for question in Question.objects.all():
+            self.assertEqual(question.answer_count, question.answers.count())
+            self.assertEqual(question.rank, sum(vote.vote for vote in question.votes.all()))
+        for answer in Answer.objects.all():
+            self.assertEqual(answer.rank, sum(vote.vote for vote in answer.votes.all()))
+        self.assertEqual(sum(TagStats.objects.values_list('question_count', flat=True)),
+                         Question.tags.through.objects.count())
+
+    def test_find_regressions(self):
+        """
+        Slower p95 beyond the tolerance and any extra queries are regressions.
+        """
+        baseline = {'index': {'p50': 5, 'p95': 10, 'p99': 20, 'queries': 3, 'errors': 0}}
+        self.assertEqual(find_regressions({'index': dict(baseline['index'], p95=11.9)}, baseline, 0.2), [])
+        self.assertEqual(find_regressions({'other': dict(baseline['index'], p95=100)}, baseline, 0.2), [])
+        regressions = find_regressions({'index': dict(baseline['index'], p95=12.1, queries=4)}, baseline, 0.2)
+        self.assertEqual(len(regressions), 2)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SAMPLE_RATE=1, INSTRUMENTATION_DUPLICATE_THRESHOLD=3)
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        view_metrics.reset()
+        self.user = create_user('user')
+        self.questions = [Question.objects.create(title='Question %d' % i, content='Content', user=self.user)
+                          for i in range(3)]
+
+    def view(self, request):
+        # an N+1: the author of every question fetched separately
+        for question in Question.objects.all():
+            UserProfile.objects.get(pk=question.user_id)
+        get_trending()
+        get_trending()
+        engine = InstrumentedDjangoTemplates({'NAME': 'test', 'DIRS': [], 'APP_DIRS': False, 'OPTIONS': {}})
+        return HttpResponse(engine.from_string('{{ value }}').render({'value': 1}))
+
+    def get(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        with self.assertLogs('otus_django.instrumentation', 'INFO') as logs:
+            response = InstrumentationMiddleware(self.view)(request)
+        return response, json.loads(logs.records[0].getMessage())
+
+    def test_request_metrics(self):
+        """
+        Sampled requests report queries, duplicated queries and cache hits and misses.
+        """
+        response, line = self.get()
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertEqual(line['db_queries'], 5)
+        self.assertEqual(list(line['duplicates'].values()), [3])
+        self.assertEqual(line['cache_hits'], {'trending': 1})
+        self.assertEqual(line['cache_misses'], {'trending': 1})
+        self.assertEqual(view_metrics.snapshot()[None]['requests'], 1)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests(self):
+        """
+        Requests outside of the sample are not measured.
+        """
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        response = InstrumentationMiddleware(self.view)(request)
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(view_metrics.snapshot(), {})
+
+    def test_metrics_view(self):
+        """
+        Per view totals are served to staff only, whatever the client address.
+        """
+        self.get()
+        request = RequestFactory().get('/metrics/', REMOTE_ADDR='127.0.0.1')
+        request.user = self.user
+        with self.assertRaises(PermissionDenied):
+            metrics_view(request)
+        self.user.is_staff = True
+        self.assertEqual(json.loads(metrics_view(request).content)['views']['null']['db_queries'], 5)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_view_token(self):
+        """
+        Requests with the configured bearer token are served the totals.
+        """
+        request = RequestFactory().get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+        request.user = AnonymousUser()
+        with self.assertRaises(PermissionDenied):
+            metrics_view(request)
+        request = RequestFactory().get('/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        request.user = AnonymousUser()
+        self.assertEqual(metrics_view(request).status_code, 200)
+
+
+@override_settings(QUESTIONS_HOT_DECAY=45000, QUESTIONS_HOT_ANSWER_WEIGHT=0.5)
+class HotScoreTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+
+    def test_hot_score_decay(self):
+        """
+        Ten times the votes make up for QUESTIONS_HOT_DECAY seconds of age.
+        """
+        now = timezone.now()
+        self.assertAlmostEqual(hot_score(100, 0, now), hot_score(10, 0, now + timedelta(seconds=45000)))
+        self.assertGreater(hot_score(1, 0, now + timedelta(seconds=1)), hot_score(1, 0, now))
+        self.assertGreater(hot_score(1, 3, now), hot_score(1, 0, now))
+        self.assertLess(hot_score(-10, 0, now), hot_score(0, 0, now))
+
+    def test_new_question_is_scored(self):
+        """
+        A new question gets its score right away.
+        """
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.hot_score, hot_score(0, 0, self.question.date_pub))
+
+    def test_recompute_recently_active(self):
+        """
+        Only the questions with votes or answers since the given time are recomputed.
+        """
+        other = Question.objects.create(title='Other', content='Content', user=self.user)
+        since = timezone.now()
+        Question.objects.update(hot_score=0)
+        self.question.vote(self.user, Vote.VOTE_UP)
+        self.assertEqual(recompute_hot_scores(since), 1)
+        self.question.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.question.hot_score, hot_score(1, 0, self.question.date_pub))
+        self.assertEqual(other.hot_score, 0)
+
+    def test_hot_ordering(self):
+        """
+        The hot feed is ordered by the stored score.
+        """
+        old = Question.objects.create(title='Old', content='Content', user=self.user, rank=5)
+        Question.objects.filter(pk=old.pk).update(date_pub=timezone.now() - timedelta(days=30))
+        self.question.vote(self.user, Vote.VOTE_UP)
+        call_command('recompute_hot_scores', all=True, stdout=StringIO())
+        view = QuestionList()
+        view.setup(RequestFactory().get('/', {'order_by': 'hot'}))
+        self.assertEqual(list(view.get_queryset()), [self.question, old])
+
+
+@override_settings(EVENTS_COALESCE_INTERVAL=0.01, EVENTS_KEEPALIVE=5, EVENTS_QUEUE_SIZE=4)
+class LiveEventsTests(TestCase):
+
+    def setUp(self):
+        self.user = create_user('user')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.user)
+
+    def test_votes_are_coalesced(self):
+        """
+        A burst of votes reaches a subscriber as one event with the latest rank.
+        """
+        def vote(user):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.question.vote(user, Vote.VOTE_UP)
+
+        users = [self.user, create_user('other')]
+
+        async def scenario():
+            queue = broker.subscribe('question:%s' % self.question.pk)
+            for user in users:
+                await sync_to_async(vote)(user)
+            event = await asyncio.wait_for(queue.get(), 1)
+            broker.unsubscribe('question:%s' % self.question.pk, queue)
+            return event, queue.empty()
+
+        event, empty = async_to_sync(scenario)()
+        self.assertEqual(event, {'question:%s' % self.question.pk: {'rank': 2}})
+        self.assertTrue(empty)
+
+    def test_full_queue_keeps_latest_values(self):
+        """
+        A stalled subscriber gets the latest values of every key in one event instead of losing the oldest.
+        """
+        async def scenario():
+            queue = broker.subscribe('poll:1')
+            for votes in range(6):
+                if votes == 2:
+                    # subscribed later, its queue doesn't fill up
+                    other = broker.subscribe('poll:1')
+                broker.publish('poll:1', 'choice:%d' % (votes % 3), votes=votes)
+                broker.flush()
+            broker.unsubscribe('poll:1', queue)
+            broker.unsubscribe('poll:1', other)
+            return drain(queue), drain(other)
+
+        events, other = async_to_sync(scenario)()
+        self.assertEqual(other, [{'choice:%d' % (votes % 3): {'votes': votes}} for votes in range(2, 6)])
+        self.assertEqual(len(events), 2)
+        self.assertEqual(merge_events(events), {'choice:0': {'votes': 3}, 'choice:1': {'votes': 4}, 'choice:2': {'votes': 5}})
+
+    def test_no_subscribers(self):
+        """
+        Nothing is queued for topics nobody listens to.
+        """
+        broker.publish('question:0', 'question:0', rank=1)
+        self.assertNotIn('question:0', broker._pending)
+
+    def test_event_stream(self):
+        """
+        The ASGI application streams the events of its topic until the client disconnects.
+        """
+        async def scenario():
+            sent = []
+            disconnect = asyncio.Event()
+
+            async def receive():
+                # first awaited once the stream is subscribed
+                broker.publish('poll:1', 'choice:3', votes=1)
+                await disconnect.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if len(sent) == 3:
+                    disconnect.set()
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/events/polls/1/'}
+            await asyncio.wait_for(with_events(None)(scope, receive, send), 1)
+            return sent
+
+        sent = async_to_sync(scenario)()
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(sent[2]['body'], b'data: {"choice:3": {"votes": 1}}\n\n')
+        self.assertNotIn('poll:1', broker._subscribers)
@@ -1,16 +1,24 @@
+from django.conf import settings
 from django.urls import path, re_path
 
 from votes.views import VoteView
 from .views import QuestionList, QuestionCreate, QuestionDetail, QuestionSearch, \
-    QuestionAnswerAward
+    QuestionAnswerAward, TagAutocomplete, PopularTags, question_list, question_detail, question_search
+
+if settings.QUESTIONS_ASYNC_VIEWS:
+    index_view, detail_view, search_view = question_list, question_detail, question_search
+else:
+    index_view, detail_view, search_view = QuestionList.as_view(), QuestionDetail.as_view(), QuestionSearch.as_view()
 
 app_name = 'questions'
 
 urlpatterns = [
-    path('', QuestionList.as_view(), name='index'),
+    path('', index_view, name='index'),
     path('add/', QuestionCreate.as_view(), name='add'),
-    path("<int:pk>/", QuestionDetail.as_view(), name='detail'),
-    path("search/", QuestionSearch.as_view(), name='search'),
+    path("<int:pk>/", detail_view, name='detail'),
+    path("search/", search_view, name='search'),
+    path("tags/", PopularTags.as_view(), name='tags'),
+    path("tags/autocomplete/", TagAutocomplete.as_view(), name='tags_autocomplete'),
     path("<int:pk>/answer/<int:answer_id>/award/", QuestionAnswerAward.as_view(), name='award'),
     re_path(r"^vote/(?P<object_name>question|answer)/(?P<object_id>\d+)/(?P<vote>up|down)/?$", VoteView.as_view(),
             name='vote')
@@ -1,33 +1,122 @@
 import logging
+from datetime import timedelta
 
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
 from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
+
+from .models import AnswerNotification
 
 logger = logging.getLogger(__name__)
 
 
-def send_email_about_new_answer(request, answer, question):
+def queue_email_about_new_answer(request, answer, question):
+    """
+    Queue the "new answer" email, answers arriving while a notification for the question
+    is still waiting are merged into a single digest email. Notifications being sent are
+    left alone, the answer gets a notification of its own.
+    """
+    with transaction.atomic():
+        updated = AnswerNotification.objects.filter(question=question, status=AnswerNotification.STATUS_PENDING). \
+            update(answer=answer, answer_count=F('answer_count') + 1)
+        if not updated:
+            AnswerNotification.objects.create(
+                question=question,
+                answer=answer,
+                question_link=request.build_absolute_uri(
+                    reverse_lazy('questions:detail', kwargs={'pk': question.pk})),
+                send_after=timezone.now() + timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW)
+            )
+
+
+def build_email_about_new_answer(notification):
+    question = notification.question
     ctx = {
         'author_username': question.user.username,
-        'user_username': answer.user.username,
+        'user_username': notification.answer.user.username if notification.answer else '',
+        'answer_count': notification.answer_count,
         'question': question,
-        'question_link': request.build_absolute_uri(
-            reverse_lazy('questions:detail', kwargs={'pk': question.pk}))
+        'question_link': notification.question_link
     }
 
     html_body = render_to_string('questions/emails/new_answer.html', ctx)
     txt_body = render_to_string('questions/emails/new_answer.txt', ctx)
-    kwargs = {
-        'subject': 'New answer to your question received',
-        'from_email': settings.DEFAULT_FROM_EMAIL,
-        'recipient_list': [question.user.email],
-        'message': txt_body,
-        'html_message': html_body
-    }
+    message = EmailMultiAlternatives(
+        subject='New answer to your question received',
+        body=txt_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[question.user.email]
+    )
+    message.attach_alternative(html_body, 'text/html')
+    return message
+
+
+def claim_due_notifications(batch_size):
+    """
+    Lease a batch of due notifications, a crashed worker's batch is retried once the lease expires.
+    Expired leases already tried NOTIFICATION_MAX_ATTEMPTS times are given up.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        AnswerNotification.objects.filter(status=AnswerNotification.STATUS_SENDING, send_after__lte=now,
+                                          attempts__gte=settings.NOTIFICATION_MAX_ATTEMPTS). \
+            update(status=AnswerNotification.STATUS_FAILED, last_error='Lease expired on the last attempt')
+        pks = list(AnswerNotification.objects.select_for_update(skip_locked=True).
+                   filter(status__in=[AnswerNotification.STATUS_PENDING, AnswerNotification.STATUS_SENDING],
+                          send_after__lte=now, attempts__lt=settings.NOTIFICATION_MAX_ATTEMPTS).
+                   order_by('send_after').values_list('pk', flat=True)[:batch_size])
+        AnswerNotification.objects.filter(pk__in=pks). \
+            update(status=AnswerNotification.STATUS_SENDING, attempts=F('attempts') + 1,
+                   send_after=now + timedelta(seconds=settings.NOTIFICATION_LEASE))
+    return list(AnswerNotification.objects.filter(pk__in=pks).
+                select_related('question__user', 'answer__user'))
+
+
+def send_due_notifications(batch_size=100):
+    """
+    Send a batch of due notifications over a single connection.
+    Returns (sent, failed) counts, failed emails are retried with exponential backoff.
+    """
+    notifications = claim_due_notifications(batch_size)
+    if not notifications:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
     try:
-        send_mail(**kwargs)
-        logger.info('Email to %s successfully sent' % question.user.email)
-    except Exception:
-        logger.exception('Email to %s was failed' % question.user.email)
\ No newline at end of file
+        connection.open()
+    except Exception as e:
+        # the whole batch is rescheduled with backoff, not left leased
+        for notification in notifications:
+            mark_notification_failed(notification, e)
+        return 0, len(notifications)
+    try:
+        for notification in notifications:
+            try:
+                connection.send_messages([build_email_about_new_answer(notification)])
+            except Exception as e:
+                failed += 1
+                mark_notification_failed(notification, e)
+            else:
+                sent += 1
+                AnswerNotification.objects.filter(pk=notification.pk). \
+                    update(status=AnswerNotification.STATUS_SENT, date_sent=timezone.now(), last_error='')
+                logger.info('Email to %s successfully sent' % notification.question.user.email)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def mark_notification_failed(notification, error):
+    logger.exception('Email to %s was failed' % notification.question.user.email)
+    if notification.attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+        status, send_after = AnswerNotification.STATUS_FAILED, notification.send_after
+    else:
+        delay = settings.NOTIFICATION_RETRY_DELAY * 2 ** (notification.attempts - 1)
+        status, send_after = AnswerNotification.STATUS_PENDING, timezone.now() + timedelta(seconds=delay)
+    AnswerNotification.objects.filter(pk=notification.pk). \
+        update(status=status, send_after=send_after, last_error=str(error))
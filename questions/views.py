@@ -1,56 +1,108 @@
+import asyncio
 import logging
 
+from asgiref.sync import sync_to_async
+
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
+from django.db import close_old_connections
 from django.db.models import Q
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views.generic import View, ListView, CreateView
 
+from otus_django.events import events_url
+from users.utils import prefetch_thumbnail_urls
+from .autocomplete import get_tag_index
+from .cache import get_trending
 from .forms import QuestionAddForm, AnswerAddForm
-from .models import Question, Answer
-from .utils import send_email_about_new_answer
+from .models import Question, Answer, Tag, TagStats
+from .pagecache import cache_anonymous_page, list_version_key, detail_version_key
+from .pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor, TagPaginator
+from .search import get_search_backend
+from .votes import UserVotes
+from .utils import queue_email_about_new_answer
 
 logger = logging.getLogger(__name__)
 
 
-class QuestionList(ListView):
+@method_decorator(cache_anonymous_page(list_version_key), name='dispatch')
+class QuestionList(CursorPaginationMixin, ListView):
     paginate_by = settings.QUESTIONS_PER_PAGE
     model = Question
     template_name = 'questions/index.html'
-    queryset = Question.objects_related.num_answers().tags().users()
+    queryset = Question.objects_related.tags().users()
+
+    def get_context_data(self, **kwargs):
+        context = super(QuestionList, self).get_context_data(**kwargs)
+        prefetch_thumbnail_urls(question.user for question in context['page_obj'])
+        return context
 
     def get_ordering(self):
         order_by = self.request.GET.get('order_by', None)
-        if order_by == 'rank':
+        if order_by == 'hot':
+            ordering = ('-hot_score', '-date_pub',)
+        elif order_by == 'rank':
             ordering = ('-rank', '-date_pub',)
         else:
             ordering = ('-date_pub',)
         return ordering
 
 
-class QuestionSearch(ListView):
+@method_decorator(cache_anonymous_page(list_version_key), name='dispatch')
+class QuestionSearch(CursorPaginationMixin, ListView):
     paginate_by = settings.QUESTIONS_PER_PAGE
     model = Question
     template_name = 'questions/search.html'
-    queryset = Question.objects_related.num_answers().tags().users()
+    queryset = Question.objects_related.tags().users()
     ordering = ('-rank', '-date_pub',)
 
-    def get_queryset(self):
-        queryset = self.queryset
+    def get_context_data(self, **kwargs):
+        context = super(QuestionSearch, self).get_context_data(**kwargs)
+        prefetch_thumbnail_urls(question.user for question in context['page_obj'])
+        return context
 
+    def get_tag_names(self):
+        names = []
         name = self.request.GET.get('t', None)
         if name:
-            queryset = queryset.filter(tags__name=name)
+            names.append(name)
         search_str = self.request.GET.get('s', None)
-        if search_str:
-            if 'tag:' in search_str:
-                name = search_str[4:].strip()
-                if name:
-                    queryset = queryset.filter(tags__name=name)
-            else:
-                queryset = queryset.filter(Q(title__contains=search_str) | Q(content__contains=search_str))
+        if search_str and 'tag:' in search_str:
+            name = search_str[4:].strip()
+            if name:
+                names.append(name)
+        return names
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        tag_ids = getattr(self, 'tag_ids', None)
+        if tag_ids and len(tag_ids) == 1:
+            stats = TagStats.objects.filter(tag_id=tag_ids[0]).first()
+            if stats:
+                return TagPaginator(queryset, per_page, stats, orphans=orphans,
+                                    allow_empty_first_page=allow_empty_first_page, **kwargs)
+        return super(QuestionSearch, self).get_paginator(
+            queryset, per_page, orphans=orphans, allow_empty_first_page=allow_empty_first_page, **kwargs)
+
+    def get_queryset(self):
+        queryset = self.queryset
+
+        names = self.get_tag_names()
+        if names:
+            # filter by tag id straight on the m2m table, without joining tags
+            ids = Tag.objects.lookup(names)
+            if len(ids) < len(set(names)):
+                return queryset.none()
+            self.tag_ids = list(set(ids.values()))
+            for tag_id in self.tag_ids:
+                queryset = queryset.filter(tags=tag_id)
+        search_str = self.request.GET.get('s', None)
+        if search_str and 'tag:' not in search_str:
+            self.tag_ids = None
+            return get_search_backend().search(queryset, search_str)
 
         ordering = self.get_ordering()
         if ordering:
@@ -61,6 +113,14 @@ class QuestionSearch(ListView):
         return queryset
 
 
+class PopularTags(ListView):
+    paginate_by = settings.TAGS_PER_PAGE
+    template_name = 'questions/tags.html'
+    context_object_name = 'tags'
+    queryset = TagStats.objects.select_related('tag').filter(question_count__gt=0). \
+        order_by('-question_count', 'tag__name')
+
+
 class QuestionCreate(LoginRequiredMixin, CreateView):
     model = Question
     form_class = QuestionAddForm
@@ -71,6 +131,7 @@ class QuestionCreate(LoginRequiredMixin, CreateView):
         return super(QuestionCreate, self).form_valid(form)
 
 
+@method_decorator(cache_anonymous_page(detail_version_key), name='dispatch')
 class QuestionDetail(View):
     template_name = 'questions/view.html'
     form_class = AnswerAddForm
@@ -84,17 +145,28 @@ class QuestionDetail(View):
             prefetch_related('user'). \
             order_by('-rank', '-date_pub')
 
+        if settings.QUESTIONS_CURSOR_PAGINATION:
+            paginator = CursorPaginator(answers_list, settings.ANSWERS_PER_PAGE)
+            try:
+                return paginator.page(request.GET.get('cursor'))
+            except InvalidCursor as e:
+                raise Http404(str(e))
+
         paginator = Paginator(answers_list, settings.ANSWERS_PER_PAGE)
         return paginator.get_page(page)
 
-    def get(self, request, pk):
-        question = self.get_question(pk)
-
+    def get_context(self, request, question):
         ctx = dict()
         ctx['question'] = question
         ctx['page_obj'] = self.paginate_answers(request, question)
         ctx['form'] = self.form_class()
+        ctx['events_url'] = events_url('questions/%s' % question.pk)
+        prefetch_thumbnail_urls([question.user] + [answer.user for answer in ctx['page_obj']])
+        return ctx
 
+    def get(self, request, pk):
+        question = self.get_question(pk)
+        ctx = self.get_context(request, question)
         return render(request, self.template_name, ctx)
 
     def post(self, request, pk):
@@ -109,13 +181,10 @@ class QuestionDetail(View):
             answer.question = question
             answer.user = request.user
             answer.save()
-            send_email_about_new_answer(self.request, answer, question)
+            queue_email_about_new_answer(self.request, answer, question)
             return redirect(reverse_lazy('questions:detail', kwargs={'pk': pk}))
 
-        ctx = dict()
-        ctx['question'] = question
-        ctx['page_obj'] = self.paginate_answers(request, question)
-        ctx['form'] = self.form_class()
+        ctx = self.get_context(request, question)
         return render(request, self.template_name, ctx)
 
 
@@ -124,4 +193,88 @@ class QuestionAnswerAward(LoginRequiredMixin, View):
     def get(self, request, pk, answer_id):
         Answer.objects.filter(pk=answer_id, question_id=pk, question__user=request.user).\
             update(is_right=Q(is_right=False))
-        return redirect(request.META.get('HTTP_REFERER'))
\ No newline at end of file
+        return redirect(request.META.get('HTTP_REFERER'))
+
+
+class TagAutocomplete(View):
+
+    def get(self, request):
+        try:
+            limit = max(1, min(int(request.GET.get('limit', settings.TAGS_AUTOCOMPLETE_LIMIT)), 50))
+        except ValueError:
+            limit = settings.TAGS_AUTOCOMPLETE_LIMIT
+        tags = get_tag_index().search(request.GET.get('q', ''), limit)
+        return JsonResponse({'tags': tags})
+
+
+# Async read views, routed instead of the class based ones when QUESTIONS_ASYNC_VIEWS is on.
+# The ORM is sync only, so independent queries run concurrently in worker threads of
+# their own and rendering happens in one hop to the thread the sync code is bound to.
+
+def run_query(func, *args, **kwargs):
+    def call():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)()
+
+
+def get_list_context(view):
+    view.object_list = view.get_queryset()
+    return view.get_context_data()
+
+
+async def render_list_view(view_class, request):
+    view = view_class()
+    view.setup(request)
+    context, request.trending = await asyncio.gather(run_query(get_list_context, view),
+                                                     run_query(get_trending))
+    response = view.render_to_response(context)
+    return await sync_to_async(response.render)()
+
+
+@cache_anonymous_page(list_version_key)
+async def question_list(request):
+    return await render_list_view(QuestionList, request)
+
+
+@cache_anonymous_page(list_version_key)
+async def question_search(request):
+    return await render_list_view(QuestionSearch, request)
+
+
+question_detail_sync = QuestionDetail.as_view()
+
+
+def get_answers_page(view, request, pk):
+    page = view.paginate_answers(request, Question(pk=pk))
+    page.object_list = list(page.object_list)
+    return page
+
+
+@cache_anonymous_page(detail_version_key)
+async def question_detail(request, pk):
+    if request.method != 'GET':
+        return await sync_to_async(question_detail_sync)(request, pk=pk)
+
+    view = QuestionDetail()
+    view.setup(request, pk=pk)
+    # evaluate the lazy user once, before it's shared with the worker threads
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    request.user_votes = UserVotes(request.user)
+    question, page_obj, votes, request.trending = await asyncio.gather(
+        run_query(view.get_question, pk),
+        run_query(get_answers_page, view, request, pk),
+        run_query(request.user_votes.fetch_question_votes, pk),
+        run_query(get_trending),
+    )
+
+    def render_detail():
+        request.user_votes.preload('question', [pk], votes['question'])
+        request.user_votes.preload('answer', [answer.pk for answer in page_obj], votes['answer'])
+        prefetch_thumbnail_urls([question.user] + [answer.user for answer in page_obj])
+        ctx = {'question': question, 'page_obj': page_obj, 'form': view.form_class(),
+               'events_url': events_url('questions/%s' % pk)}
+        return render(request, view.template_name, ctx)
+    return await sync_to_async(render_detail)()
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import CharField, Value
+
+from votes.models import RankedVoteModel
+from .models import Question, Answer
+
+
+class UserVotes:
+    """
+    Lazy per-request resolver of the current user's votes.
+
+    Objects are registered as they are rendered and all votes still unknown
+    are fetched with one query per model on the first lookup that needs them.
+    """
+    models = {
+        'question': Question,
+        'answer': Answer,
+    }
+    context_keys = ('question', 'page_obj')
+
+    def __init__(self, user):
+        self.user = user
+        self._votes = {model_name: {} for model_name in self.models}
+        self._pending = {model_name: set() for model_name in self.models}
+        self._primed = False
+
+    def expect(self, model_name, pks):
+        if model_name not in self.models:
+            return
+        known = self._votes[model_name]
+        self._pending[model_name].update(pk for pk in pks if pk not in known)
+
+    def expect_objects(self, objects):
+        for obj in objects:
+            if isinstance(obj, RankedVoteModel) and obj.pk:
+                self.expect(obj._meta.model_name, [obj.pk])
+
+    def preload(self, model_name, pks, votes):
+        """
+        Store votes fetched elsewhere, pks without a vote are known to have none
+        """
+        known = self._votes[model_name]
+        known.update(dict.fromkeys(pks))
+        known.update(votes)
+        self._pending[model_name].difference_update(known)
+        if settings.VOTES_BUFFERED and self.user.is_authenticated:
+            self._apply_buffered(model_name, ContentType.objects.get_for_model(self.models[model_name]), set(pks))
+
+    def fetch_question_votes(self, question_pk):
+        """
+        Fetch the user's votes for a question and all of its answers in one query,
+        returns {model_name: {pk: vote}} to be passed to preload
+        """
+        votes = {model_name: {} for model_name in self.models}
+        if not self.user.is_authenticated:
+            return votes
+        targets = {
+            'question': [question_pk],
+            'answer': Answer.objects.filter(question_id=question_pk).values('pk'),
+        }
+        rows = None
+        for model_name, object_ids in targets.items():
+            model = self.models[model_name]
+            vote_model = model.get_vote_model()
+            model_rows = vote_model.for_targets(model, object_ids).filter(user_id=self.user.pk). \
+                annotate(model_name=Value(model_name, output_field=CharField())). \
+                values_list('model_name', vote_model.target_attname, 'vote')
+            rows = model_rows if rows is None else rows.union(model_rows, all=True)
+        for model_name, pk, vote in rows:
+            votes[model_name][pk] = vote
+        return votes
+
+    def prime(self, context):
+        """
+        Register the objects a page is about to render (the question and the paginated list)
+        """
+        if self._primed:
+            return
+        self._primed = True
+        for key in self.context_keys:
+            value = context.get(key)
+            if isinstance(value, RankedVoteModel):
+                self.expect_objects([value])
+            elif value is not None and hasattr(value, '__iter__') and not isinstance(value, (str, dict)):
+                self.expect_objects(value)
+
+    def _load(self):
+        user_id = self.user.pk if self.user.is_authenticated else None
+        for model_name, pks in self._pending.items():
+            if not pks:
+                continue
+            votes = self._votes[model_name]
+            votes.update(dict.fromkeys(pks))
+            if user_id:
+                model = self.models[model_name]
+                vote_model = model.get_vote_model()
+                votes.update(vote_model.for_targets(model, pks).filter(user_id=user_id).
+                             values_list(vote_model.target_attname, 'vote'))
+                if settings.VOTES_BUFFERED:
+                    self._apply_buffered(model_name, ContentType.objects.get_for_model(model), pks)
+            pks.clear()
+
+    def _apply_buffered(self, model_name, content_type, pks):
+        from votes.buffer import vote_buffer
+        for (content_type_id, pk), vote in vote_buffer.pending_for_user(self.user.pk).items():
+            if content_type_id == content_type.pk and pk in pks:
+                self._votes[model_name][pk] = vote or None
+
+    def get(self, model_name, pk):
+        votes = self._votes.get(model_name)
+        if votes is None:
+            return
+        if pk not in votes:
+            self.expect(model_name, [pk])
+            self._load()
+        elif self._pending[model_name]:
+            self._load()
+        return votes.get(pk)
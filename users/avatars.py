@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+FORMAT_EXTENSIONS = {
+    'PNG': 'png',
+    'WEBP': 'webp',
+}
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.USER_IMAGE_WORKERS, thread_name_prefix='avatars')
+    return _executor
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def thumbnail_names(avatar_name):
+    """
+    Returns {(size, format): name} of all thumbnails of an avatar,
+    the first size in PNG keeps the historical 'thumbnail.<name>.png' name
+    """
+    basename, _ = os.path.splitext(os.path.basename(avatar_name))
+    names = {}
+    for i, size in enumerate(settings.USER_IMAGE_SIZES):
+        for image_format in settings.USER_IMAGE_FORMATS:
+            suffix = '' if i == 0 else '.%dx%d' % size
+            names[(size, image_format)] = '%s/thumbnail.%s%s.%s' % (
+                settings.USER_IMAGE_DIR, basename, suffix, FORMAT_EXTENSIONS[image_format])
+    return names
+
+
+def render_thumbnails(image):
+    """
+    Fit the image to every configured size, decoding it only once.
+    Large JPEGs are decoded at a reduced scale and every size is reduced
+    from the previous one before the final resampling.
+    """
+    sizes = sorted(settings.USER_IMAGE_SIZES, key=lambda size: size[0] * size[1], reverse=True)
+    largest = sizes[0]
+    if image.format == 'JPEG':
+        image.draft('RGB', (largest[0] * 2, largest[1] * 2))
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or 'A' in image.mode else 'RGB')
+    for size in sizes:
+        factor = min(image.width // (size[0] * 2), image.height // (size[1] * 2))
+        if factor > 1:
+            image = image.reduce(factor)
+        yield size, ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def process_avatar(user_pk, avatar_name, avatar_hash):
+    """
+    Generate the thumbnails of an avatar and store the main thumbnail path on the user,
+    unless the avatar has been replaced in the meantime
+    """
+    from .models import UserProfile
+
+    names = thumbnail_names(avatar_name)
+    with default_storage.open(avatar_name) as file:
+        image = Image.open(file)
+        for size, thumbnail in render_thumbnails(image):
+            for image_format in settings.USER_IMAGE_FORMATS:
+                buffer = BytesIO()
+                thumbnail.save(buffer, format=image_format)
+                name = names[(size, image_format)]
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                names[(size, image_format)] = default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    thumbnail = names[(settings.USER_IMAGE_SIZES[0], settings.USER_IMAGE_FORMATS[0])]
+    UserProfile.objects.filter(pk=user_pk, avatar=avatar_name, avatar_hash=avatar_hash). \
+        update(thumbnail=thumbnail)
+    return thumbnail
+
+
+def _process_avatar_in_background(user_pk, avatar_name, avatar_hash):
+    try:
+        process_avatar(user_pk, avatar_name, avatar_hash)
+    except Exception:
+        logger.exception('Avatar %s processing failed' % avatar_name)
+    finally:
+        connection.close()
+
+
+def schedule_avatar_processing(user):
+    """
+    Process the avatar on the worker pool once the transaction is committed,
+    or right away when USER_IMAGE_ASYNC is off
+    """
+    args = (user.pk, user.avatar.name, user.avatar_hash)
+    if not settings.USER_IMAGE_ASYNC:
+        user.thumbnail = process_avatar(*args)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_process_avatar_in_background, *args))
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:48
+
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def backfill_thumbnail(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    for user in UserProfile.objects.exclude(avatar='').only('pk', 'avatar').iterator():
+        basename, _ = os.path.splitext(os.path.basename(user.avatar.name))
+        name = '%s/thumbnail.%s.png' % (settings.USER_IMAGE_DIR, basename)
+        if default_storage.exists(name):
+            UserProfile.objects.filter(pk=user.pk).update(thumbnail=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_thumbnail, migrations.RunPython.noop),
+    ]
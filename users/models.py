@@ -1,46 +1,63 @@
-import os
-from io import BytesIO
-from urllib.parse import quote, urljoin
-
-from PIL import Image, ImageOps
-from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
 from django.db import models
 
+from .avatars import file_hash, schedule_avatar_processing, thumbnail_names
+from .utils import prefetch_thumbnail_urls
+
 
 class UserProfile(AbstractUser):
     email = models.EmailField(unique=True)
     avatar = models.ImageField(upload_to=settings.USER_IMAGE_DIR)
+    avatar_hash = models.CharField(max_length=64, blank=True, editable=False)
+    thumbnail = models.CharField(max_length=255, blank=True, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(UserProfile, cls).from_db(db, field_names, values)
+        instance._loaded_avatar = instance.__dict__.get('avatar')
+        return instance
+
+    def avatar_changed(self, update_fields=None):
+        """
+        Whether the avatar has to be processed: a new file with a different content hash
+        or a different stored file. Clears the thumbnail when the avatar is removed.
+        """
+        if update_fields is not None and 'avatar' not in update_fields:
+            return False
+        if not self.avatar:
+            self.avatar_hash = self.thumbnail = ''
+            return False
+        if self.avatar._committed:
+            return self.avatar.name != getattr(self, '_loaded_avatar', None)
+        digest = file_hash(self.avatar)
+        if digest == self.avatar_hash:
+            return False
+        self.avatar_hash = digest
+        return True
 
-    # todo resize image only if user.created or image field has been updated
     def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        changed = self.avatar_changed(update_fields)
+        if update_fields is not None and 'avatar' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'avatar_hash', 'thumbnail'}
         super(UserProfile, self).save(*args, **kwargs)
-        if self.avatar:
-            buffer = BytesIO()
-            image = Image.open(self.avatar)
-            thumbnail = ImageOps.fit(image, settings.USER_IMAGE_SIZE, Image.ANTIALIAS)
-            thumbnail.save(buffer, format="PNG")
-            default_storage.save(self.thumbnail_name, ContentFile(buffer.getvalue()))
+        self._loaded_avatar = self.avatar.name
+        if changed:
+            schedule_avatar_processing(self)
+            self.__dict__.pop('_thumbnail_url', None)
 
     @property
     def thumbnail_name(self):
         if not self.avatar:
             return
-        basename, _ = os.path.splitext(os.path.basename(self.avatar.name))
-        filename = '%s/thumbnail.%s.png' % (settings.USER_IMAGE_DIR, basename)
-        return filename
+        return thumbnail_names(self.avatar.name)[(settings.USER_IMAGE_SIZES[0], settings.USER_IMAGE_FORMATS[0])]
 
     @property
     def thumbnail_url(self):
-        if self.thumbnail_name and default_storage.exists(self.thumbnail_name):
-            return default_storage.url(self.thumbnail_name)
-        else:
-            placeholder = settings.USER_IMAGE_PLACEHOLDER
-            if apps.is_installed('django.contrib.staticfiles'):
-                from django.contrib.staticfiles.storage import staticfiles_storage
-                return staticfiles_storage.url(placeholder)
-            else:
-                return urljoin(settings.STATIC_URL, quote(placeholder))
\ No newline at end of file
+        """
+        Url of the stored thumbnail or the placeholder, never touches the storage
+        """
+        if not hasattr(self, '_thumbnail_url'):
+            prefetch_thumbnail_urls([self])
+        return self._thumbnail_url
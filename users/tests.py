@@ -1,3 +1,86 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from .models import UserProfile
+from .utils import get_placeholder_url, prefetch_thumbnail_urls
+
+
+class ThumbnailUrlTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [UserProfile(username='user%d' % i, thumbnail='avatars/thumbnail.%d.png' % i) for i in range(3)]
+        self.users.append(UserProfile(username='no_avatar'))
+
+    @mock.patch('django.core.files.storage.default_storage.exists', side_effect=AssertionError)
+    def test_thumbnail_url_never_checks_storage(self, exists):
+        """
+        thumbnail_url is built from the persisted thumbnail path.
+        """
+        self.assertEqual(self.users[0].thumbnail_url, '/avatars/thumbnail.0.png')
+        self.assertEqual(self.users[-1].thumbnail_url, get_placeholder_url())
+
+    def test_prefetch_thumbnail_urls(self):
+        """
+        Urls of many users are resolved with one cache lookup and then served from the cache.
+        """
+        with mock.patch('django.core.cache.cache.get_many', wraps=cache.get_many) as get_many:
+            prefetch_thumbnail_urls(self.users)
+        get_many.assert_called_once()
+        with mock.patch('django.core.files.storage.default_storage.url', side_effect=AssertionError):
+            users = prefetch_thumbnail_urls([UserProfile(thumbnail=user.thumbnail) for user in self.users])
+        self.assertEqual([user.thumbnail_url for user in users], [user.thumbnail_url for user in self.users])
+
+
+def make_avatar(name='avatar.jpg', color='red'):
+    buffer = BytesIO()
+    Image.new('RGB', (1200, 800), color).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class AvatarProcessingTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root, USER_IMAGE_ASYNC=False)
+        self.settings_override.enable()
+        self.user = UserProfile.objects.create(username='user', email='user@example.com', avatar=make_avatar())
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def test_thumbnails_are_generated(self):
+        """
+        Every configured size and format is generated and the main thumbnail is persisted.
+        """
+        user = UserProfile.objects.get(pk=self.user.pk)
+        self.assertEqual(user.thumbnail, user.thumbnail_name)
+        with default_storage.open(user.thumbnail) as file:
+            self.assertEqual(Image.open(file).size, (200, 200))
+        self.assertTrue(default_storage.exists(user.thumbnail_name.replace('.png', '.48x48.webp')))
+
+    @mock.patch('users.avatars.process_avatar')
+    def test_unchanged_avatar_is_not_processed(self, process_avatar):
+        """
+        Saves that don't change the avatar content skip the image processing.
+        """
+        user = UserProfile.objects.get(pk=self.user.pk)
+        user.last_login = None
+        user.save(update_fields=['last_login'])
+        user.email = 'changed@example.com'
+        user.save()
+        user.avatar = make_avatar()
+        user.save()
+        process_avatar.assert_not_called()
+        user.avatar = make_avatar(color='blue')
+        user.save()
+        process_avatar.assert_called_once()
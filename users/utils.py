@@ -0,0 +1,43 @@
+from functools import lru_cache
+from urllib.parse import quote, urljoin
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from otus_django.instrumentation import record_cache
+
+THUMBNAIL_URL_CACHE_KEY = 'users:thumbnail_url:%s'
+
+
+@lru_cache(maxsize=None)
+def get_placeholder_url():
+    placeholder = settings.USER_IMAGE_PLACEHOLDER
+    if apps.is_installed('django.contrib.staticfiles'):
+        from django.contrib.staticfiles.storage import staticfiles_storage
+        return staticfiles_storage.url(placeholder)
+    else:
+        return urljoin(settings.STATIC_URL, quote(placeholder))
+
+
+def prefetch_thumbnail_urls(users):
+    """
+    Resolve the thumbnail urls of many users with a single cache round-trip,
+    the urls are stored on the user objects and read back by UserProfile.thumbnail_url
+    """
+    users = [user for user in users if user is not None and not hasattr(user, '_thumbnail_url')]
+    names = {user.thumbnail for user in users if user.thumbnail}
+    urls = {}
+    if names:
+        keys = {THUMBNAIL_URL_CACHE_KEY % name: name for name in names}
+        urls = {keys[key]: url for key, url in cache.get_many(keys).items()}
+        missing = {name: default_storage.url(name) for name in names if name not in urls}
+        record_cache('thumbnail_urls', hits=len(urls), misses=len(missing))
+        if missing:
+            cache.set_many({THUMBNAIL_URL_CACHE_KEY % name: url for name, url in missing.items()},
+                           settings.USER_THUMBNAIL_URL_CACHE_TIMEOUT)
+            urls.update(missing)
+    for user in users:
+        user._thumbnail_url = urls[user.thumbnail] if user.thumbnail else get_placeholder_url()
+    return users
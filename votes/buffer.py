@@ -0,0 +1,218 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+
+from .signals import rank_changed
+
+logger = logging.getLogger(__name__)
+
+NO_VOTE = 0
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for votes.
+
+    Votes are coalesced per (content_type_id, object_id, user_id) into the final
+    state the user ends up with and written in batches by a background thread.
+    Each entry keeps the state it started from, so the pending rank delta of an
+    object can be overlaid on top of the stored rank until the next flush.
+    """
+
+    def __init__(self, flush_interval, max_size):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _lookup(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._flushing.get(key)
+
+    def _stored_vote(self, key):
+        content_type_id, object_id, user_id = key
+        model_cls = ContentType.objects.get_for_id(content_type_id).model_class()
+        vote = model_cls.get_vote_model().for_targets(model_cls, [object_id]).filter(user_id=user_id). \
+            values_list('vote', flat=True).first()
+        return vote or NO_VOTE
+
+    def add(self, user_id, content_type_id, object_id, vote):
+        """
+        Queue a vote click, toggling the user's current (possibly buffered) vote.
+        Returns the vote the user ends up with (0 when the vote was discarded).
+        """
+        key = (content_type_id, object_id, user_id)
+        stored = None
+        if self._lookup(key) is None:
+            # read outside the lock, only used when no click of the user was buffered meanwhile
+            stored = self._stored_vote(key)
+        with self._lock:
+            entry = self._lookup(key) or (stored, stored)
+            initial, current = entry
+            current = NO_VOTE if current == vote else vote
+            self._pending[key] = (initial, current)
+            size = len(self._pending)
+        if size >= self.max_size:
+            self._wakeup.set()
+        self._ensure_worker()
+        return current
+
+    def pending_vote(self, user_id, content_type_id, object_id):
+        entry = self._lookup((content_type_id, object_id, user_id))
+        if entry is not None:
+            return entry[1]
+
+    def pending_rank_delta(self, content_type_id, object_id):
+        delta = 0
+        with self._lock:
+            # an entry buffered during a flush starts from the flushed entry's initial vote and supersedes it
+            entries = {**self._flushing, **self._pending}
+        for (ct_id, obj_id, _), (initial, current) in entries.items():
+            if ct_id == content_type_id and obj_id == object_id:
+                delta += current - initial
+        return delta
+
+    def pending_for_user(self, user_id):
+        """
+        Returns {(content_type_id, object_id): vote} of the buffered votes of the user
+        """
+        votes = {}
+        with self._lock:
+            for entries in (self._flushing, self._pending):
+                for (ct_id, obj_id, entry_user_id), (_, current) in entries.items():
+                    if entry_user_id == user_id:
+                        votes[(ct_id, obj_id)] = current
+        return votes
+
+    def flush(self):
+        """
+        Write all buffered votes and apply one rank delta per voted object.
+        Returns the number of coalesced votes written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._flushing, self._pending = self._pending, {}
+            try:
+                self._write(self._flushing)
+            except Exception:
+                logger.exception('Vote buffer flush failed, %d votes requeued', len(self._flushing))
+                with self._lock:
+                    for key, entry in self._flushing.items():
+                        self._pending.setdefault(key, entry)
+                    self._flushing = {}
+                return 0
+            with self._lock:
+                # clicks buffered during the flush now start from the votes just stored
+                for key, (_, current) in self._flushing.items():
+                    if key in self._pending:
+                        self._pending[key] = (current, self._pending[key][1])
+                written, self._flushing = len(self._flushing), {}
+            return written
+
+    def _write(self, entries):
+        by_content_type = defaultdict(dict)
+        for key, entry in entries.items():
+            by_content_type[key[0]][key] = entry
+        with transaction.atomic():
+            for content_type_id, model_entries in by_content_type.items():
+                self._write_model(ContentType.objects.get_for_id(content_type_id).model_class(), model_entries)
+
+    def _existing(self, model_cls, entries):
+        """
+        The entries whose object and user still exist, votes of deleted ones are dropped
+        instead of failing the whole flush on the foreign keys
+        """
+        _, object_ids, user_ids = (set(i) for i in zip(*entries))
+        object_ids = set(model_cls._default_manager.filter(pk__in=object_ids).values_list('pk', flat=True))
+        user_ids = set(get_user_model()._default_manager.filter(pk__in=user_ids).values_list('pk', flat=True))
+        existing = {key: entry for key, entry in entries.items() if key[1] in object_ids and key[2] in user_ids}
+        if len(existing) < len(entries):
+            logger.warning('Dropped %d buffered votes of deleted %s objects or users',
+                           len(entries) - len(existing), model_cls._meta.label)
+        return existing
+
+    def _write_model(self, model_cls, entries):
+        entries = self._existing(model_cls, entries)
+        if not entries:
+            return
+        vote_model = model_cls.get_vote_model()
+        _, object_ids, user_ids = (set(i) for i in zip(*entries))
+        existing = {}
+        content_type_id = next(iter(entries))[0]
+        candidates = vote_model.for_targets(model_cls, object_ids).select_for_update().filter(user_id__in=user_ids)
+        for vote_obj in candidates:
+            key = (content_type_id, getattr(vote_obj, vote_model.target_attname), vote_obj.user_id)
+            if key in entries:
+                existing[key] = vote_obj
+
+        to_create, to_update, to_delete = [], [], []
+        deltas = defaultdict(int)
+        for key, (_, current) in entries.items():
+            _, object_id, user_id = key
+            vote_obj = existing.get(key)
+            stored = vote_obj.vote if vote_obj else NO_VOTE
+            if current == stored:
+                continue
+            deltas[object_id] += current - stored
+            if vote_obj is None:
+                to_create.append(vote_model.build(model_cls, object_id, user_id, current))
+            elif current == NO_VOTE:
+                to_delete.append(vote_obj.pk)
+            else:
+                vote_obj.vote = current
+                to_update.append(vote_obj)
+
+        vote_model.objects.bulk_create(to_create)
+        vote_model.objects.bulk_update(to_update, ['vote'])
+        vote_model.objects.filter(pk__in=to_delete).delete()
+
+        deltas = {object_id: delta for object_id, delta in deltas.items() if delta}
+        for object_id, delta in deltas.items():
+            model_cls._default_manager.filter(pk=object_id).update(rank=F('rank') + delta,
+                                                                   **model_cls.rank_update_fields())
+        # the stored ranks after the flush, live counters are set to absolute values
+        ranks = dict(model_cls._default_manager.filter(pk__in=deltas).values_list('pk', 'rank'))
+        for object_id, delta in deltas.items():
+            rank_changed.send(sender=model_cls, pk=object_id, rank=ranks.get(object_id), delta=delta)
+
+    def _ensure_worker(self):
+        if not self.flush_interval or (self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='vote-buffer-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            finally:
+                connection.close_if_unusable_or_obsolete()
+
+
+vote_buffer = VoteBuffer(flush_interval=settings.VOTES_BUFFER_FLUSH_INTERVAL,
+                         max_size=settings.VOTES_BUFFER_MAX_SIZE)
+atexit.register(vote_buffer.flush)
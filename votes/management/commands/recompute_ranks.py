@@ -0,0 +1,38 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from votes.models import RankedVoteModel
+from votes.signals import rank_changed
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rank of voted objects from the votes table to repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', metavar='app_label.ModelName',
+                            help='Restrict recomputation to the given models (default: all ranked models)')
+
+    def get_models(self, labels):
+        if not labels:
+            return [model for model in apps.get_models() if issubclass(model, RankedVoteModel)]
+        models = []
+        for label in labels:
+            try:
+                model = apps.get_model(label)
+            except (LookupError, ValueError):
+                raise CommandError('Unknown model: %s' % label)
+            if not issubclass(model, RankedVoteModel):
+                raise CommandError('%s is not a ranked model' % label)
+            models.append(model)
+        return models
+
+    def handle(self, *args, **options):
+        for model in self.get_models(options['models']):
+            vote_model = model.get_vote_model()
+            rank = vote_model.for_model(model).filter(**{vote_model.target_attname: OuterRef('pk')}). \
+                order_by().values(vote_model.target_attname).annotate(rank=Sum('vote')).values('rank')
+            updated = model._default_manager.update(rank=Coalesce(Subquery(rank), 0))
+            rank_changed.send(sender=model, pk=None, rank=None, delta=None)
+            self.stdout.write('%s: %d ranks recomputed' % (model._meta.label, updated))
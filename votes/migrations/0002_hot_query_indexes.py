@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """
+    Keep the first vote of every (user, content_type, object_id), run recompute_ranks afterwards
+    """
+    Vote = apps.get_model('votes', 'Vote')
+    duplicates = Vote.objects.values('user', 'content_type', 'object_id'). \
+        annotate(keep=Min('pk'), count=Count('pk')).filter(count__gt=1)
+    for duplicate in duplicates.iterator():
+        Vote.objects.filter(user=duplicate['user'], content_type=duplicate['content_type'],
+                            object_id=duplicate['object_id']).exclude(pk=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('votes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vote',
+            index=models.Index(fields=['content_type', 'object_id'], name='vote_object_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='vote',
+            constraint=models.UniqueConstraint(fields=('user', 'content_type', 'object_id'), name='unique_user_vote'),
+        ),
+    ]
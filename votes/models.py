@@ -1,44 +1,154 @@
+from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
-from django.db.models import Sum
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
 
 from users.models import UserProfile
+from .signals import rank_changed
 
 
-class Vote(models.Model):
+class BaseVote(models.Model):
     VOTE_UP = 1
     VOTE_DOWN = -1
     VOTE_CHOICES = (
         (VOTE_UP, 'Vote Up'),
         (VOTE_DOWN, 'Vote Down')
     )
+    # name of the column holding the pk of the voted object
+    target_attname = None
+    vote = models.SmallIntegerField(choices=VOTE_CHOICES)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def for_model(cls, model):
+        """
+        Votes of the objects of a ranked model, the whole table when it only holds the votes of one model
+        """
+        return cls.objects.all()
+
+    @classmethod
+    def for_targets(cls, model, object_ids):
+        return cls.for_model(model).filter(**{'%s__in' % cls.target_attname: object_ids})
+
+    @classmethod
+    def build(cls, model, object_id, user_id, vote):
+        return cls(**{cls.target_attname: object_id, 'user_id': user_id, 'vote': vote})
+
+    def on_vote_change(self):
+        """
+        Recompute the rank of the voted object from scratch.
+        Used to repair drift, regular voting goes through RankedVoteModel.vote
+        """
+        model = self.target_model()
+        related_obj = model._default_manager.get(pk=getattr(self, self.target_attname))
+        rank = self.for_targets(model, [related_obj.pk]).aggregate(rank=Sum('vote'))['rank']
+        related_obj.update_rank(rank)
+
+
+class Vote(BaseVote):
+    """
+    Generic vote storage, any ranked model can keep its votes here
+    """
+    target_attname = 'object_id'
     user = models.ForeignKey(UserProfile, related_name='votes', on_delete=models.CASCADE)
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
-    vote = models.SmallIntegerField(choices=VOTE_CHOICES)
 
-    def on_vote_change(self):
-        content_type = ContentType.objects.get(pk=self.content_type.pk)
-        related_obj = content_type.get_object_for_this_type(pk=self.object_id)
-        rank = Vote.objects.filter(content_type=self.content_type, object_id=self.object_id). \
-            aggregate(rank=Sum('vote'))['rank']
-        related_obj.update_rank(rank)
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='unique_user_vote'),
+        ]
+        indexes = [
+            models.Index(fields=['content_type', 'object_id'], name='vote_object_idx'),
+        ]
+
+    @classmethod
+    def for_model(cls, model):
+        return cls.objects.filter(content_type=ContentType.objects.get_for_model(model))
+
+    @classmethod
+    def build(cls, model, object_id, user_id, vote):
+        return cls(content_type=ContentType.objects.get_for_model(model), object_id=object_id,
+                   user_id=user_id, vote=vote)
+
+    def target_model(self):
+        return ContentType.objects.get_for_id(self.content_type_id).model_class()
+
+
+class TargetVote(BaseVote):
+    """
+    Typed vote storage of a single ranked model: a real foreign key and a unique
+    (target, user) key without the content type column. Subclasses declare
+    `target = models.ForeignKey(<model>, related_name='votes', ...)`.
+    """
+    target_attname = 'target_id'
+    id = models.AutoField(primary_key=True)
+    user = models.ForeignKey(UserProfile, related_name='+', on_delete=models.CASCADE)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def target_model(cls):
+        return cls._meta.get_field('target').related_model
 
 
 class RankedVoteModel(models.Model):
-    votes = GenericRelation(Vote)
+    """
+    Votable model with a denormalized rank. The votes are the `votes` relation:
+    a TargetVote subclass with `related_name='votes'` or the generic table
+    through GenericRankedVoteModel.
+    """
     rank = models.IntegerField(blank=True, default=0)
 
     class Meta:
         abstract = True
 
+    @classmethod
+    def get_vote_model(cls):
+        """
+        Vote, or the TargetVote subclass of models with a typed vote table
+        """
+        return cls._meta.get_field('votes').related_model
+
     def update_rank(self, rank):
         if not self.pk:
             return
-        self.rank = rank or 0
-        return self.save()
+        previous, self.rank = self.rank, rank or 0
+        self.save(update_fields=['rank'])
+        rank_changed.send(sender=type(self), pk=self.pk, rank=self.rank, delta=self.rank - previous)
+
+    @classmethod
+    def rank_update_fields(cls):
+        """
+        Other columns to set along with the rank, saves a second UPDATE in rank_changed handlers
+        """
+        return {}
+
+    def apply_rank_delta(self, delta):
+        """
+        Shift the stored rank by delta with a single UPDATE of the rank column
+        """
+        if not self.pk or not delta:
+            return
+        type(self)._default_manager.filter(pk=self.pk).update(rank=F('rank') + delta, **self.rank_update_fields())
+        self.refresh_from_db(fields=['rank'])
+        rank_changed.send(sender=type(self), pk=self.pk, rank=self.rank, delta=delta)
+
+    @property
+    def current_rank(self):
+        """
+        Stored rank plus the votes still waiting in the write-behind buffer
+        """
+        if not settings.VOTES_BUFFERED or not self.pk:
+            return self.rank
+        from .buffer import vote_buffer
+        content_type = ContentType.objects.get_for_model(self)
+        return self.rank + vote_buffer.pending_rank_delta(content_type.pk, self.pk)
 
     def vote(self, user, vote):
         """
@@ -49,15 +159,45 @@ class RankedVoteModel(models.Model):
                 delete vote (+)
             elif previous_vote == -:
                 update vote (- => +)
+
+        The rank is shifted by the resulting delta in the same transaction.
+        With VOTES_BUFFERED the vote is queued and written by the next buffer flush.
+        Returns the vote the user ends up with, None when it was discarded.
         """
-        content_type = ContentType.objects.get_by_natural_key(self._meta.app_label, self._meta.model_name)
+        if settings.VOTES_BUFFERED:
+            from .buffer import vote_buffer
+            content_type = ContentType.objects.get_for_model(self)
+            return vote_buffer.add(user.pk, content_type.pk, self.pk, vote) or None
         try:
-            previous = Vote.objects.get(user=user, object_id=self.pk, content_type=content_type)
-            if previous.vote == vote:
-                previous.delete()
-            else:
-                previous.vote = vote
-                previous.save()
-        except Vote.DoesNotExist:
-            vote_obj = Vote(user=user, object_id=self.pk, content_type=content_type, vote=vote)
-            vote_obj.save()
\ No newline at end of file
+            return self._vote(user, vote)
+        except IntegrityError:
+            # a concurrent first vote of the user won the insert, toggle against the stored vote
+            return self._vote(user, vote)
+
+    def _vote(self, user, vote):
+        vote_model = self.get_vote_model()
+        with transaction.atomic():
+            try:
+                previous = vote_model.for_targets(type(self), [self.pk]).select_for_update().get(user=user)
+                if previous.vote == vote:
+                    previous.delete()
+                    delta, vote = -vote, None
+                else:
+                    previous.vote = vote
+                    previous.save(update_fields=['vote'])
+                    delta = 2 * vote
+            except vote_model.DoesNotExist:
+                vote_model.build(type(self), self.pk, user.pk, vote).save()
+                delta = vote
+            self.apply_rank_delta(delta)
+        return vote
+
+
+class GenericRankedVoteModel(RankedVoteModel):
+    """
+    Ranked model keeping its votes in the generic Vote table
+    """
+    votes = GenericRelation(Vote)
+
+    class Meta:
+        abstract = True
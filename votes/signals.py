@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# sent by RankedVoteModel and the vote buffer whenever a stored rank changes
+# kwargs: pk (None for bulk changes), rank (new rank or None when not fetched), delta (None when unknown)
+rank_changed = Signal()
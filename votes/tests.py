@@ -1,3 +1,266 @@
-from django.test import TestCase
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from questions.models import Question, Answer, QuestionVote
+from users.models import UserProfile
+from .buffer import VoteBuffer
+from .models import Vote
+from .signals import rank_changed
+from .utils import get_vote_state
+
+
+def create_user(username):
+    return UserProfile.objects.create(username=username, email='%s@example.com' % username)
+
+
+class RankedVoteModelTests(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.voter = create_user('voter')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.author)
+
+    def test_vote_up(self):
+        """
+        A new vote shifts the rank by its value.
+        """
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.assertEqual(self.question.rank, 1)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 1)
+
+    def test_vote_twice_discards_vote(self):
+        """
+        Voting the same way twice removes the vote and restores the rank.
+        """
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 0)
+        self.assertFalse(self.question.votes.exists())
+
+    def test_change_vote(self):
+        """
+        Switching a vote moves the rank by twice the vote value.
+        """
+        other = create_user('other')
+        self.question.vote(other, Vote.VOTE_UP)
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.question.vote(self.voter, Vote.VOTE_DOWN)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 0)
+        self.assertEqual(self.question.votes.get(user=self.voter).vote, Vote.VOTE_DOWN)
+
+    def test_racing_first_vote(self):
+        """
+        A first vote losing the insert to a concurrent one is toggled against the stored vote.
+        """
+        # the concurrent vote is committed after this request looked for a previous one
+        QuestionVote.objects.create(target=self.question, user=self.voter, vote=Vote.VOTE_UP)
+        Question.objects.filter(pk=self.question.pk).update(rank=1)
+        for_targets = QuestionVote.for_targets
+        missed = [QuestionVote.objects.none()]
+
+        def racing_for_targets(*args):
+            return missed.pop() if missed else for_targets(*args)
+
+        with mock.patch.object(QuestionVote, 'for_targets', side_effect=racing_for_targets):
+            self.assertIsNone(self.question.vote(self.voter, Vote.VOTE_UP))
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 0)
+        self.assertFalse(self.question.votes.exists())
+
+    def test_typed_storage(self):
+        """
+        Question and answer votes go to their own tables, the generic table stays empty.
+        """
+        answer = Answer.objects.create(question=self.question, content='Answer', user=self.author)
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        answer.vote(self.voter, Vote.VOTE_DOWN)
+        self.assertEqual(list(QuestionVote.objects.values_list('target', 'user', 'vote')),
+                         [(self.question.pk, self.voter.pk, Vote.VOTE_UP)])
+        self.assertEqual(list(answer.votes.values_list('user', 'vote')), [(self.voter.pk, Vote.VOTE_DOWN)])
+        self.assertFalse(Vote.objects.exists())
+        Answer.objects.filter(pk=answer.pk).update(rank=42)
+        answer.votes.get().on_vote_change()
+        self.assertEqual(Answer.objects.get(pk=answer.pk).rank, -1)
+
+    def test_recompute_ranks(self):
+        """
+        recompute_ranks restores ranks that drifted from the votes table.
+        """
+        self.question.vote(self.voter, Vote.VOTE_DOWN)
+        Question.objects.filter(pk=self.question.pk).update(rank=42)
+        call_command('recompute_ranks', 'questions.Question', stdout=StringIO())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, -1)
+
+
+class VoteBufferTests(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.voter = create_user('voter')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.author)
+        self.content_type = ContentType.objects.get_for_model(Question)
+        self.buffer = VoteBuffer(flush_interval=0, max_size=100)
+
+    def add(self, user, vote):
+        return self.buffer.add(user.pk, self.content_type.pk, self.question.pk, vote)
+
+    def test_votes_are_coalesced(self):
+        """
+        Several clicks of one user end up as a single vote row after the flush.
+        """
+        self.add(self.voter, Vote.VOTE_UP)
+        self.add(self.voter, Vote.VOTE_DOWN)
+        self.assertFalse(self.question.votes.exists())
+        self.assertEqual(self.buffer.pending_rank_delta(self.content_type.pk, self.question.pk), -1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.question.votes.get().vote, Vote.VOTE_DOWN)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, -1)
+
+    def test_flush_sends_stored_ranks(self):
+        """
+        rank_changed receivers get the stored rank of every object the flush changed.
+        """
+        Question.objects.filter(pk=self.question.pk).update(rank=5)
+        self.add(self.voter, Vote.VOTE_UP)
+        receiver = mock.Mock()
+        rank_changed.connect(receiver, sender=Question)
+        try:
+            self.buffer.flush()
+        finally:
+            rank_changed.disconnect(receiver, sender=Question)
+        receiver.assert_called_once_with(signal=rank_changed, sender=Question, pk=self.question.pk, rank=6, delta=1)
+
+    def test_flush_drops_votes_of_deleted_objects(self):
+        """
+        A vote of a deleted question is dropped, the other buffered votes are still written.
+        """
+        other = Question.objects.create(title='Other', content='Content', user=self.author)
+        self.add(self.voter, Vote.VOTE_UP)
+        self.buffer.add(self.voter.pk, self.content_type.pk, other.pk, Vote.VOTE_UP)
+        other.delete()
+        with self.assertLogs('votes.buffer', 'WARNING'):
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(len(self.buffer), 0)
+        self.assertEqual(self.question.votes.get().vote, Vote.VOTE_UP)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 1)
+
+    def test_flush_discards_stored_vote(self):
+        """
+        Toggling a stored vote through the buffer deletes it on flush.
+        """
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.assertEqual(self.add(self.voter, Vote.VOTE_UP), 0)
+        self.buffer.flush()
+        self.assertFalse(self.question.votes.exists())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 0)
+
+    def test_pending_votes_are_visible_to_voter(self):
+        """
+        The voting user sees their buffered vote before the flush.
+        """
+        self.add(self.voter, Vote.VOTE_UP)
+        self.assertEqual(self.buffer.pending_vote(self.voter.pk, self.content_type.pk, self.question.pk), 1)
+        self.assertEqual(self.buffer.pending_for_user(self.voter.pk), {(self.content_type.pk, self.question.pk): 1})
+        self.assertEqual(self.buffer.pending_for_user(self.author.pk), {})
+
+    def test_vote_during_flush(self):
+        """
+        A click buffered while a flush writes the previous one is counted once, before and after the flush.
+        """
+        self.add(self.voter, Vote.VOTE_UP)
+        write = self.buffer._write
+        deltas = []
+
+        def write_with_click(entries):
+            self.add(self.voter, Vote.VOTE_DOWN)
+            deltas.append(self.buffer.pending_rank_delta(self.content_type.pk, self.question.pk))
+            write(entries)
+
+        with mock.patch.object(self.buffer, '_write', write_with_click):
+            self.buffer.flush()
+        self.assertEqual(deltas, [-1])
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 1)
+        self.assertEqual(self.buffer.pending_rank_delta(self.content_type.pk, self.question.pk), -2)
+        self.buffer.flush()
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, -1)
+        self.assertEqual(self.question.votes.get().vote, Vote.VOTE_DOWN)
+
+    @override_settings(VOTES_BUFFERED=True)
+    def test_buffered_vote(self):
+        """
+        In buffered mode the vote is only reflected by current_rank until the flush.
+        """
+        from .buffer import vote_buffer
+        self.question.vote(self.voter, Vote.VOTE_UP)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 0)
+        self.assertEqual(self.question.current_rank, 1)
+        vote_buffer.flush()
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 1)
+
+
+class VoteViewTests(TestCase):
+
+    def setUp(self):
+        self.author = create_user('author')
+        self.voter = create_user('voter')
+        self.question = Question.objects.create(title='Question', content='Content', user=self.author)
+        self.answer = Answer.objects.create(question=self.question, content='Answer', user=self.author)
+        self.client.force_login(self.voter)
+
+    def vote_url(self, object_name, pk, vote):
+        return reverse('questions:vote', kwargs={'object_name': object_name, 'object_id': pk, 'vote': vote})
+
+    def test_widget_has_no_inline_script(self):
+        """
+        Every votes widget links the same static script instead of carrying a copy of it.
+        """
+        html = render_to_string('questions/include/votes.html', {'obj': self.answer})
+        self.assertIn('data-vote="1"', html)
+        self.assertNotIn('<script', html)
+        self.assertIn('questions/votes.js', render_to_string('questions/include/votes_script.html'))
+
+    def test_post_returns_rank_and_vote(self):
+        """
+        A POST votes and answers with the new rank and the user's vote instead of a redirect.
+        """
+        response = self.client.post(self.vote_url('answer', self.answer.pk, 'down'))
+        self.assertEqual(response.json(), {'rank': -1, 'user_vote': Vote.VOTE_DOWN,
+                                           'state': get_vote_state(Vote.VOTE_DOWN)})
+        response = self.client.post(self.vote_url('answer', self.answer.pk, 'down'))
+        self.assertEqual(response.json(), {'rank': 0, 'user_vote': None,
+                                           'state': get_vote_state(None)})
+        response = self.client.post(self.vote_url('question', self.question.pk, 'up'))
+        self.assertEqual(response.json(), {'rank': 1, 'user_vote': Vote.VOTE_UP,
+                                           'state': get_vote_state(Vote.VOTE_UP)})
+
+    def test_get_redirects_back(self):
+        """
+        The plain vote links keep voting and redirecting to the referring page.
+        """
+        response = self.client.get(self.vote_url('question', self.question.pk, 'up'), HTTP_REFERER='/page/')
+        self.assertRedirects(response, '/page/', fetch_redirect_response=False)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).rank, 1)
+
+    def test_invalid_object(self):
+        """
+        Unknown objects are rejected without voting.
+        """
+        response = self.client.post(self.vote_url('question', 0, 'up'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.question.votes.exists())
+
+    @override_settings(VOTES_BUFFERED=True)
+    def test_buffered_post(self):
+        """
+        The returned rank includes the vote still waiting in the buffer.
+        """
+        from .buffer import vote_buffer
+        response = self.client.post(self.vote_url('question', self.question.pk, 'up'))
+        self.assertEqual(response.json(), {'rank': 1, 'user_vote': Vote.VOTE_UP,
+                                           'state': get_vote_state(Vote.VOTE_UP)})
+        vote_buffer.flush()
@@ -0,0 +1,13 @@
+from .models import Vote
+
+
+def get_vote_state(vote):
+    """
+    Css classes and titles of the up/down vote links for the user's vote
+    """
+    return {
+        'up_class': 'text-success' if vote == Vote.VOTE_UP else 'text-secondary',
+        'up_title': 'Discard my vote' if vote == Vote.VOTE_UP else 'Up vote',
+        'down_class': 'text-success' if vote == Vote.VOTE_DOWN else 'text-secondary',
+        'down_title': 'Discard my vote' if vote == Vote.VOTE_DOWN else 'Down vote',
+    }
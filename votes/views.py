@@ -1,34 +1,62 @@
+from functools import lru_cache
+
 from django.apps import apps
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseBadRequest
+from django.http import HttpResponseBadRequest, JsonResponse
 from django.shortcuts import redirect
 from django.views.generic import View
 
-from .models import Vote
+from .models import Vote, RankedVoteModel
+from .utils import get_vote_state
+
+
+@lru_cache(maxsize=None)
+def get_vote_models(app_label):
+    """
+    Model name -> model of the votable models of an app, computed once per app
+    """
+    return {model._meta.model_name: model for model in apps.get_app_config(app_label).get_models()
+            if issubclass(model, RankedVoteModel)}
 
 
 class VoteView(LoginRequiredMixin, View):
+    """
+    GET votes and redirects back to the page, POST votes and answers with the new rank,
+    the user's vote and the state of the vote links as JSON
+    """
     redirect_field_name = None
+    votes_map = {
+        'up': Vote.VOTE_UP,
+        'down': Vote.VOTE_DOWN
+    }
 
-    def get(self, request, object_name, object_id, vote):
-        votes_map = {
-            'up': Vote.VOTE_UP,
-            'down': Vote.VOTE_DOWN
-        }
-        vote = votes_map.get(vote)
+    def vote(self, request, object_name, object_id, vote):
+        """
+        Returns the voted object and the user's resulting vote or an error response
+        """
+        vote = self.votes_map.get(vote)
         if not vote:
-            return HttpResponseBadRequest('Invalid vote value')
-        app_label = request.resolver_match.app_name
+            return None, HttpResponseBadRequest('Invalid vote value')
+        model_cls = get_vote_models(request.resolver_match.app_name).get(object_name)
+        if model_cls is None:
+            return None, HttpResponseBadRequest('Invalid object name')
         try:
-            model_cls = apps.get_model(app_label, object_name)
-            try:
-                model_object = model_cls.objects.get(pk=object_id)
-                model_object.vote(request.user, vote)
-            except model_cls.DoesNotExist:
-                return HttpResponseBadRequest('Invalid object id')
-        except LookupError:
-            return HttpResponseBadRequest('Invalid object name')
+            model_object = model_cls.objects.only('pk', 'rank').get(pk=object_id)
+        except model_cls.DoesNotExist:
+            return None, HttpResponseBadRequest('Invalid object id')
+        return model_object, model_object.vote(request.user, vote)
+
+    def get(self, request, object_name, object_id, vote):
+        model_object, result = self.vote(request, object_name, object_id, vote)
+        if model_object is None:
+            return result
         if request.path != request.META.get('HTTP_REFERER'):
             return redirect(request.META.get('HTTP_REFERER'))
         else:
-            return redirect('/')
\ No newline at end of file
+            return redirect('/')
+
+    def post(self, request, object_name, object_id, vote):
+        model_object, result = self.vote(request, object_name, object_id, vote)
+        if model_object is None:
+            return result
+        return JsonResponse({'rank': model_object.current_rank, 'user_vote': result, 'state': get_vote_state(result)})